@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+封面图片元数据回填脚本
+遍历cover_picture表，下载COS中的图片，重新计算主要颜色等衍生数据并批量写回数据库。
+支持断点续跑、试运行和吞吐量统计。
+
+用法:
+    python backfill_covers.py [--workers 2] [--batch-size 50] [--dry-run]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from wxcloudrun import app
+from wxcloudrun.cos_client import cos_client
+from wxcloudrun.dao import bulk_update_cover_pictures, query_cover_picture_batch
+from wxcloudrun.image_processing import compute_cover_metadata
+
+DEFAULT_CHECKPOINT = 'backfill_covers.checkpoint.json'
+
+
+def load_checkpoint(path):
+    """读取断点文件，不存在时从头开始"""
+    if not os.path.exists(path):
+        return {'last_id': 0, 'processed': 0, 'updated': 0, 'failed': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """先写临时文件再替换，避免中断时留下不完整的断点文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def download(picture_name):
+    """下载图片，失败时返回None"""
+    try:
+        return cos_client.download_cover_image(picture_name)
+    except Exception as e:
+        print(f"下载失败 {picture_name}: {str(e)}")
+        return None
+
+
+def process_batch(rows, download_pool, process_pool):
+    """
+    下载并重新计算一批图片
+    :return: (需要更新的记录列表, 失败的图片名称列表, 下载字节数)
+    """
+    images = list(download_pool.map(download, [row.picture_name for row in rows]))
+
+    pending = [(row, data) for row, data in zip(rows, images) if data is not None]
+    failed = [row.picture_name for row, data in zip(rows, images) if data is None]
+    futures = [process_pool.submit(compute_cover_metadata, data) for _, data in pending]
+
+    mappings = []
+    for (row, _), future in zip(pending, futures):
+        try:
+            metadata = future.result()
+        except Exception as e:
+            print(f"处理失败 {row.picture_name}: {str(e)}")
+            failed.append(row.picture_name)
+            continue
+        if metadata['major_color'] != row.major_color:
+            mappings.append(dict(metadata, id=row.id))
+
+    return mappings, failed, sum(len(data) for _, data in pending)
+
+
+def backfill(workers, download_workers, batch_size, checkpoint_path, dry_run, limit):
+    checkpoint = {'last_id': 0, 'processed': 0, 'updated': 0, 'failed': []} if dry_run \
+        else load_checkpoint(checkpoint_path)
+    if checkpoint['last_id']:
+        print(f"从断点继续: id > {checkpoint['last_id']}")
+
+    start = time.perf_counter()
+    processed = updated = downloaded_bytes = 0
+    mp_context = multiprocessing.get_context('spawn')
+
+    with app.app_context(), \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as process_pool:
+        while limit is None or processed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            rows = query_cover_picture_batch(checkpoint['last_id'], size)
+            if not rows:
+                break
+
+            mappings, failed, batch_bytes = process_batch(rows, download_pool, process_pool)
+            if dry_run:
+                for mapping in mappings:
+                    print(f"[dry-run] id={mapping['id']} major_color -> {mapping['major_color']}")
+            else:
+                bulk_update_cover_pictures(mappings)
+
+            processed += len(rows)
+            updated += len(mappings)
+            downloaded_bytes += batch_bytes
+            checkpoint['last_id'] = rows[-1].id
+            checkpoint['processed'] += len(rows)
+            checkpoint['updated'] += len(mappings)
+            checkpoint['failed'].extend(failed)
+            if not dry_run:
+                save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - start
+            print(f"已处理 {processed} 张，更新 {updated} 张，失败 {len(checkpoint['failed'])} 张，"
+                  f"{processed / elapsed:.2f} 张/秒，{downloaded_bytes / elapsed / 1024 / 1024:.2f} MB/秒，"
+                  f"当前ID {checkpoint['last_id']}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n完成: 处理 {processed} 张，{'需更新' if dry_run else '已更新'} {updated} 张，"
+          f"耗时 {elapsed:.1f} 秒")
+    if checkpoint['failed']:
+        print(f"失败的图片: {', '.join(checkpoint['failed'])}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='重新计算封面图片的主要颜色等元数据')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='图片处理进程数')
+    parser.add_argument('--download-workers', type=int, default=8, help='并发下载线程数')
+    parser.add_argument('--batch-size', type=int, default=50, help='每批处理和提交的记录数')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='断点文件路径')
+    parser.add_argument('--restart', action='store_true', help='忽略已有断点，从头开始')
+    parser.add_argument('--dry-run', action='store_true', help='只计算并输出变化，不写数据库和断点')
+    parser.add_argument('--limit', type=int, default=None, help='本次最多处理的记录数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    print("开始回填封面图片元数据...")
+    backfill(args.workers, args.download_workers, args.batch_size, args.checkpoint, args.dry_run, args.limit)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+图片处理基准测试
+在本地启动多线程服务(SQLite + 本地存储)，并发上传一批大尺寸JPEG，同时持续请求
+/api/cover/list，统计上传吞吐量和读接口延迟。每个IMAGE_PROCESS_WORKERS取值在独立子进程中运行，
+0表示在请求进程内处理图片。
+
+用法:
+    python bench/bench_image_pool.py                          # 对比0和2个工作进程
+    python bench/bench_image_pool.py --workers 0 1 4 --uploads 24 --concurrency 6
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_jpeg(width, height, seed):
+    """
+    :return: 带噪声的JPEG，解码、缩放和编码的开销接近真实照片
+    """
+    from PIL import Image
+    noise = [Image.effect_noise((width, height), 40 + seed % 7 + channel) for channel in range(3)]
+    image = Image.merge('RGB', noise)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_once(args):
+    """
+    在当前进程中按args.workers运行一轮测试，结果以JSON输出到标准输出
+    """
+    work_dir = tempfile.mkdtemp(prefix='yesidosvc_bench_')
+    # 环境变量需要在导入wxcloudrun之前设置，进程池的工作进程也会继承
+    os.environ.update({
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_DIR': os.path.join(work_dir, 'storage'),
+        'RATE_LIMIT_ENABLED': 'false',
+        'ACCESS_LOG_ENABLED': 'false',
+        'IMAGE_PROCESS_WORKERS': str(args.workers),
+        'MYSQL_REPLICA_ADDRESSES': ''
+    })
+    sys.path.insert(0, ROOT)
+    import requests
+    from werkzeug.serving import make_server
+
+    import config
+    from wxcloudrun import app, db
+    from wxcloudrun.image_processing import get_image_pool
+    import wxcloudrun.views  # noqa: F401
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(work_dir, 'bench.db')
+    app.config['DEBUG'] = False
+    with app.app_context():
+        db.create_all(bind=None)
+
+    images = [make_jpeg(args.width, args.height, i) for i in range(min(args.uploads, 4))]
+    pool = get_image_pool()
+    if pool is not None:
+        # 启动工作进程，避免把spawn的耗时计入第一批上传
+        pool.submit(len, b'').result()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    headers = {'Admin-Secret': config.ADMIN_SECRET}
+
+    def read_latencies(stop, latencies):
+        with requests.Session() as session:
+            while not stop.is_set():
+                started = time.perf_counter()
+                session.get(f'{base_url}/api/cover/list', headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                time.sleep(args.read_interval)
+
+    def upload(i):
+        started = time.perf_counter()
+        response = requests.post(f'{base_url}/api/cover/upload', headers=headers, files={
+            'file': (f'bench-{i}.jpg', images[i % len(images)], 'image/jpeg')
+        })
+        ok = response.status_code == 200 and response.json().get('code') == 0
+        return ok, response.status_code, (time.perf_counter() - started) * 1000
+
+    # 空闲时的读延迟作为基线
+    idle, stop = [], threading.Event()
+    reader = threading.Thread(target=read_latencies, args=(stop, idle))
+    reader.start()
+    time.sleep(args.idle_seconds)
+    stop.set()
+    reader.join()
+
+    busy, stop = [], threading.Event()
+    reader = threading.Thread(target=read_latencies, args=(stop, busy))
+    reader.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(upload, range(args.uploads)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader.join()
+    server.shutdown()
+
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    succeeded = [latency for ok, _, latency in results if ok]
+    print(json.dumps({
+        'workers': args.workers,
+        'uploads_ok': len(succeeded),
+        'statuses': statuses,
+        'uploads_per_s': round(len(succeeded) / elapsed, 2),
+        'upload_p50_ms': round(percentile(succeeded, 0.5), 1),
+        'idle_read_p50_ms': round(percentile(idle, 0.5), 1),
+        'read_p50_ms': round(percentile(busy, 0.5), 1),
+        'read_p99_ms': round(percentile(busy, 0.99), 1),
+        'read_max_ms': round(max(busy, default=0), 1),
+        'reads': len(busy)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发上传时的图片处理吞吐量和读接口延迟')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2], help='要对比的IMAGE_PROCESS_WORKERS取值')
+    parser.add_argument('--uploads', type=int, default=16, help='每轮上传的图片数')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发上传数')
+    parser.add_argument('--width', type=int, default=1800)
+    parser.add_argument('--height', type=int, default=1400)
+    parser.add_argument('--read-interval', type=float, default=0.01, help='两次读请求之间的间隔秒数')
+    parser.add_argument('--idle-seconds', type=float, default=2, help='测量空闲读延迟的秒数')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        args.workers = args.workers[0]
+        run_once(args)
+        return
+
+    print(f"CPU: {os.cpu_count()}  上传: {args.uploads}张 {args.width}x{args.height} JPEG  并发: {args.concurrency}")
+    print(f"{'workers':>7} {'ok':>4} {'upload/s':>9} {'upload p50':>11} {'idle read p50':>14} "
+          f"{'read p50':>9} {'read p99':>9} {'read max':>9} {'statuses'}")
+    for workers in args.workers:
+        command = [sys.executable, os.path.abspath(__file__), '--run', '--workers', str(workers),
+                   '--uploads', str(args.uploads), '--concurrency', str(args.concurrency),
+                   '--width', str(args.width), '--height', str(args.height),
+                   '--read-interval', str(args.read_interval), '--idle-seconds', str(args.idle_seconds)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=ROOT).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['workers']:>7} {result['uploads_ok']:>4} {result['uploads_per_s']:>9} "
+              f"{result['upload_p50_ms']:>9}ms {result['idle_read_p50_ms']:>12}ms "
+              f"{result['read_p50_ms']:>7}ms {result['read_p99_ms']:>7}ms {result['read_max_ms']:>7}ms "
+              f"{result['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
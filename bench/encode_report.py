@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+封面编码节省字节报告
+用Pillow合成一组样本(照片类JPEG、截图类PNG、带透明通道的PNG、动图GIF)，按当前的字节预算配置
+编码，输出每个样本的原始大小、编码后大小和节省比例。
+
+用法:
+    python bench/encode_report.py
+    python bench/encode_report.py --format WEBP --budget 204800
+"""
+
+import argparse
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_corpus():
+    """
+    :return: [(样本名, 图片二进制数据)]
+    """
+    from PIL import Image, ImageDraw
+
+    def save(image, format, **params):
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **params)
+        return buffer.getvalue()
+
+    def photo(width, height):
+        # 渐变叠加噪声，压缩特性接近照片
+        base = Image.linear_gradient('L').resize((width, height))
+        noise = [Image.effect_noise((width, height), sigma) for sigma in (30, 45, 60)]
+        return Image.merge('RGB', [Image.blend(base, channel, 0.5) for channel in noise])
+
+    def screenshot(width, height, mode):
+        image = Image.new(mode, (width, height), (245, 245, 245, 255)[:len(mode)])
+        draw = ImageDraw.Draw(image)
+        for row in range(0, height, 40):
+            draw.rectangle((20, row + 8, width - 20, row + 30), fill=(40 + row % 180, 90, 160, 200)[:len(mode)])
+            draw.text((30, row + 12), f'row {row} ' * 12, fill=(0, 0, 0, 255)[:len(mode)])
+        return image
+
+    frames = [Image.new('P', (400, 300), index * 20) for index in range(12)]
+    for index, frame in enumerate(frames):
+        ImageDraw.Draw(frame).ellipse((index * 25, 50, index * 25 + 100, 150), fill=255 - index)
+    gif = io.BytesIO()
+    frames[0].save(gif, format='GIF', save_all=True, append_images=frames[1:], duration=80, loop=0)
+
+    return [
+        ('photo_3000x2000.jpg', save(photo(3000, 2000), 'JPEG', quality=95)),
+        ('photo_1200x800.jpg', save(photo(1200, 800), 'JPEG', quality=98)),
+        ('screenshot_2400x1600.png', save(screenshot(2400, 1600, 'RGB'), 'PNG')),
+        ('overlay_1600x1000_alpha.png', save(screenshot(1600, 1000, 'RGBA'), 'PNG')),
+        ('animation_400x300.gif', gif.getvalue())
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告合成样本按字节预算编码后节省的字节数')
+    parser.add_argument('--format', default='', help='IMAGE_OUTPUT_FORMAT，默认保持原格式')
+    parser.add_argument('--budget', type=int, help='IMAGE_BYTE_BUDGET，默认使用配置值')
+    args = parser.parse_args()
+
+    # 配置在导入时读取，需要先设置环境变量
+    os.environ['IMAGE_OUTPUT_FORMAT'] = args.format
+    if args.budget is not None:
+        os.environ['IMAGE_BYTE_BUDGET'] = str(args.budget)
+    sys.path.insert(0, ROOT)
+    import config
+    from wxcloudrun.image_processing import encode_cover_image
+
+    print(f"预算: {config.IMAGE_BYTE_BUDGET} bytes  质量: {config.IMAGE_QUALITY_MIN}-{config.IMAGE_QUALITY_MAX}  "
+          f"输出格式: {config.IMAGE_OUTPUT_FORMAT or '原格式'}")
+    print(f"{'sample':<30} {'original':>10} {'encoded':>10} {'format':>7} {'saved':>7}")
+    total_original = total_encoded = 0
+    for name, data in build_corpus():
+        encoded, output_format = encode_cover_image(data)
+        total_original += len(data)
+        total_encoded += len(encoded)
+        print(f"{name:<30} {len(data):>10} {len(encoded):>10} {output_format:>7} "
+              f"{1 - len(encoded) / len(data):>7.1%}")
+    print(f"{'total':<30} {total_original:>10} {total_encoded:>10} {'':>7} "
+          f"{1 - total_encoded / total_original:>7.1%}")
+
+
+if __name__ == '__main__':
+    main()
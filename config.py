@@ -3,17 +3,117 @@ import os
 # 是否开启debug模式
 DEBUG = True
 
+# 日志：级别、异步日志队列长度(队列满时丢弃)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# 访问日志：是否开启、采样率(0~1)、慢请求阈值(毫秒，慢请求和5xx总是记录)
+ACCESS_LOG_ENABLED = os.environ.get("ACCESS_LOG_ENABLED", "true").lower() == "true"
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", 1))
+ACCESS_LOG_SLOW_MS = float(os.environ.get("ACCESS_LOG_SLOW_MS", 1000))
+
 # 读取数据库环境变量
 username = os.environ.get("MYSQL_USERNAME", 'root')
 password = os.environ.get("MYSQL_PASSWORD", 'root')
 db_address = os.environ.get("MYSQL_ADDRESS", '127.0.0.1:3306')
 
+# 只读从库地址，多个用逗号分隔(留空表示不使用从库)，账号密码与主库相同，也可以填写带协议的完整连接串；连接超时(秒)
+DB_REPLICA_ADDRESSES = [address.strip() for address in os.environ.get("MYSQL_REPLICA_ADDRESSES", "").split(",")
+                        if address.strip()]
+DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get("DB_REPLICA_CONNECT_TIMEOUT", 2))
+# 从库连续失败次数达到阈值后暂停使用的时间(秒)、管理员写操作后读操作走主库的时间(秒)
+DB_REPLICA_FAILURE_THRESHOLD = int(os.environ.get("DB_REPLICA_FAILURE_THRESHOLD", 1))
+DB_REPLICA_RESET_TIMEOUT = float(os.environ.get("DB_REPLICA_RESET_TIMEOUT", 30))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5))
+
+# 数据库连接池：回收时间(秒)，取出连接前检测连接是否存活
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# 启动预热：是否开启，预热时建立的数据库连接数(不超过连接池大小5)
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_DB_CONNECTIONS = int(os.environ.get("WARMUP_DB_CONNECTIONS", 2))
+# 预热时数据库步骤失败后的重试退避(秒)，一直重试到成功为止
+WARMUP_RETRY_BASE_DELAY = float(os.environ.get("WARMUP_RETRY_BASE_DELAY", 0.5))
+WARMUP_RETRY_MAX_DELAY = float(os.environ.get("WARMUP_RETRY_MAX_DELAY", 15))
+
+# 数据库读操作重试和熔断配置
+DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", 3))
+DB_RETRY_BASE_DELAY = float(os.environ.get("DB_RETRY_BASE_DELAY", 0.05))
+DB_RETRY_MAX_DELAY = float(os.environ.get("DB_RETRY_MAX_DELAY", 1))
+DB_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("DB_BREAKER_FAILURE_THRESHOLD", 5))
+DB_BREAKER_RESET_TIMEOUT = float(os.environ.get("DB_BREAKER_RESET_TIMEOUT", 10))
+
 # 腾讯云COS配置
 COS_SECRET_ID = os.environ.get("COS_SECRET_ID", "your_secret_id")
 COS_SECRET_KEY = os.environ.get("COS_SECRET_KEY", "your_secret_key")
 COS_REGION = os.environ.get("COS_REGION", "ap-beijing")
 COS_BUCKET_NAME = os.environ.get("COS_BUCKET", "wechat-miniprogram")
 
+# 存储后端：cos为腾讯云COS，local为本地文件系统替身(本地调试和测试用)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "cos")
+LOCAL_STORAGE_DIR = os.environ.get("LOCAL_STORAGE_DIR", "/tmp/yesidosvc_storage")
+LOCAL_STORAGE_BASE_URL = os.environ.get("LOCAL_STORAGE_BASE_URL", "http://127.0.0.1:80")
+LOCAL_STORAGE_SECRET = os.environ.get("LOCAL_STORAGE_SECRET", "local_storage_secret")
+
+# 客户端直传：预签名地址有效期(秒)、原图大小上限(字节)、处理中任务的租约(秒)，
+# 租约过期的处理中任务(如实例缩容或崩溃)可以重新提交处理，应大于单个任务的最长处理时间
+DIRECT_UPLOAD_EXPIRES = int(os.environ.get("DIRECT_UPLOAD_EXPIRES", 600))
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get("DIRECT_UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+DIRECT_UPLOAD_LEASE_SECONDS = int(os.environ.get("DIRECT_UPLOAD_LEASE_SECONDS", 300))
+
+# COS操作执行器配置：工作线程数、排队上限、单次请求超时(秒)、各操作等待超时(秒)
+COS_EXECUTOR_WORKERS = int(os.environ.get("COS_EXECUTOR_WORKERS", 4))
+COS_EXECUTOR_QUEUE_SIZE = int(os.environ.get("COS_EXECUTOR_QUEUE_SIZE", 8))
+COS_REQUEST_TIMEOUT = int(os.environ.get("COS_REQUEST_TIMEOUT", 10))
+COS_UPLOAD_TIMEOUT = float(os.environ.get("COS_UPLOAD_TIMEOUT", 30))
+COS_DELETE_TIMEOUT = float(os.environ.get("COS_DELETE_TIMEOUT", 10))
+COS_HEAD_TIMEOUT = float(os.environ.get("COS_HEAD_TIMEOUT", 5))
+
+# 图片处理进程池：工作进程数(0表示在当前进程处理)、排队上限、处理超时(秒)
+IMAGE_PROCESS_WORKERS = int(os.environ.get("IMAGE_PROCESS_WORKERS", 1))
+IMAGE_PROCESS_QUEUE_SIZE = int(os.environ.get("IMAGE_PROCESS_QUEUE_SIZE", 4))
+IMAGE_PROCESS_TIMEOUT = float(os.environ.get("IMAGE_PROCESS_TIMEOUT", 20))
+
+# 图片编码：输出格式(JPEG/WEBP，留空保持原格式)、单张字节预算(0表示不限制)、质量搜索区间、JPEG是否渐进式
+IMAGE_OUTPUT_FORMAT = os.environ.get("IMAGE_OUTPUT_FORMAT", "").upper()
+IMAGE_BYTE_BUDGET = int(os.environ.get("IMAGE_BYTE_BUDGET", 400 * 1024))
+IMAGE_QUALITY_MIN = int(os.environ.get("IMAGE_QUALITY_MIN", 40))
+IMAGE_QUALITY_MAX = int(os.environ.get("IMAGE_QUALITY_MAX", 85))
+IMAGE_PROGRESSIVE_JPEG = os.environ.get("IMAGE_PROGRESSIVE_JPEG", "true").lower() == "true"
+
+# 变更订阅长轮询：最长等待(秒)、每个进程同时等待的请求上限、查询其他实例写入的间隔(秒)、
+# 单次增量的变更条数上限(超过时客户端重新拉取全量)、版本号不连续时的等待时间(秒)
+CHANGE_FEED_MAX_TIMEOUT = float(os.environ.get("CHANGE_FEED_MAX_TIMEOUT", 30))
+CHANGE_FEED_MAX_WAITERS = int(os.environ.get("CHANGE_FEED_MAX_WAITERS", 100))
+CHANGE_FEED_POLL_INTERVAL = float(os.environ.get("CHANGE_FEED_POLL_INTERVAL", 2))
+CHANGE_FEED_MAX_CHANGES = int(os.environ.get("CHANGE_FEED_MAX_CHANGES", 500))
+CHANGE_FEED_SETTLE_SECONDS = float(os.environ.get("CHANGE_FEED_SETTLE_SECONDS", 3))
+# 变更日志保留：保留天数、最多保留的条数，超出任一限制的旧变更由prune_change_log.py删除
+CHANGE_LOG_RETENTION_DAYS = float(os.environ.get("CHANGE_LOG_RETENTION_DAYS", 7))
+CHANGE_LOG_RETENTION_ROWS = int(os.environ.get("CHANGE_LOG_RETENTION_ROWS", 100000))
+
+# 图片入库检查：原图字节上限、单帧像素上限、动图帧数上限、动图总像素上限、预计解码内存上限(字节)、取主要颜色的缩略图边长
+IMAGE_MAX_INPUT_BYTES = int(os.environ.get("IMAGE_MAX_INPUT_BYTES", 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 50000000))
+IMAGE_MAX_FRAMES = int(os.environ.get("IMAGE_MAX_FRAMES", 300))
+IMAGE_MAX_ANIMATION_PIXELS = int(os.environ.get("IMAGE_MAX_ANIMATION_PIXELS", 200000000))
+IMAGE_DECODE_MEMORY_BUDGET = int(os.environ.get("IMAGE_DECODE_MEMORY_BUDGET", 512 * 1024 * 1024))
+IMAGE_COLOR_SAMPLE_SIZE = int(os.environ.get("IMAGE_COLOR_SAMPLE_SIZE", 256))
+
+# Flask请求体大小上限，超过时直接返回413，不读取请求体
+MAX_CONTENT_LENGTH = max(IMAGE_MAX_INPUT_BYTES, DIRECT_UPLOAD_MAX_BYTES) + 1024 * 1024
+
+# 公开接口限流配置，状态保存在共享内存文件中，多个工作进程共用
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE_PATH = os.environ.get("RATE_LIMIT_STORE_PATH", "")
+RATE_LIMIT_SLOTS = int(os.environ.get("RATE_LIMIT_SLOTS", 8192))
+# 各接口限流：每秒补充令牌数、桶容量
+RATE_LIMIT_USER_INFO_RATE = float(os.environ.get("RATE_LIMIT_USER_INFO_RATE", 5))
+RATE_LIMIT_USER_INFO_BURST = int(os.environ.get("RATE_LIMIT_USER_INFO_BURST", 20))
+RATE_LIMIT_COUNT_RATE = float(os.environ.get("RATE_LIMIT_COUNT_RATE", 2))
+RATE_LIMIT_COUNT_BURST = int(os.environ.get("RATE_LIMIT_COUNT_BURST", 10))
+
 # 管理员密钥
 ADMIN_SECRET = os.environ.get("ADMIN_SECRET", "admin_secret_key_2024")
 
@@ -5,21 +5,23 @@
 """
 
 from wxcloudrun import app, db
-from wxcloudrun.model import Counters, CoverPicture, User
+from wxcloudrun.model import ChangeLog, Counters, CoverPicture, CoverUpload, User
 
 def init_database():
     """初始化数据库表"""
     with app.app_context():
         try:
-            # 创建所有表
-            db.create_all()
+            # 创建所有表，只在主库执行，从库通过复制同步表结构
+            db.create_all(bind=None)
             print("数据库表创建成功！")
             
             # 打印创建的表信息
             print("\n已创建的表:")
             print("- Counters (计数表)")
             print("- cover_picture (封面图片表)")
+            print("- cover_upload (封面直传任务表)")
             print("- users (用户表)")
+            print("- change_log (数据变更日志表)")
             
         except Exception as e:
             print(f"数据库初始化失败: {str(e)}")
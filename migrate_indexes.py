@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+补建索引脚本
+db.create_all只创建不存在的表，已有的表不会补上模型中后来新增的索引(如cover_picture的
+primary_cover、createdAt，users的user_name、role、createdAt)。本脚本对比模型和数据库中的索引，
+输出并执行缺少的CREATE INDEX语句，可重复执行。
+
+用法:
+    python migrate_indexes.py [--dry-run]
+"""
+
+import argparse
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+from wxcloudrun import app, db
+from wxcloudrun.model import ChangeLog, Counters, CoverPicture, CoverUpload, User  # noqa: F401
+
+
+def missing_indexes(connection):
+    """
+    :return: 模型中定义、数据库已有的表上却不存在的索引列表
+    """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        # 尚未创建的表由init_db.py连同索引一起创建
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                missing.append(index)
+    return missing
+
+
+def migrate(dry_run):
+    with app.app_context():
+        # 只在主库执行，从库通过复制同步
+        engine = db.get_engine(app)
+        with engine.begin() as connection:
+            indexes = missing_indexes(connection)
+            if not indexes:
+                print("索引已是最新，无需补建")
+                return 0
+            for index in indexes:
+                print(f"{CreateIndex(index).compile(dialect=engine.dialect)};")
+                if not dry_run:
+                    index.create(bind=connection)
+    print(f"\n{'需要' if dry_run else '已'}补建索引 {len(indexes)} 个")
+    return len(indexes)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='为已有的表补建模型中新增的索引')
+    parser.add_argument('--dry-run', action='store_true', help='只输出需要执行的DDL，不修改数据库')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    migrate(args.dry_run)
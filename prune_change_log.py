@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+变更日志清理脚本
+按版本号从旧到新分批删除超过保留天数(CHANGE_LOG_RETENTION_DAYS)或超出保留条数(CHANGE_LOG_RETENTION_ROWS)
+的变更日志，最新的一条总是保留。版本号早于保留的最小版本的订阅客户端会收到reset并重新拉取全量。
+可由定时任务定期执行，重复执行是安全的。
+
+用法:
+    python prune_change_log.py [--dry-run] [--days 7] [--rows 100000] [--batch-size 1000]
+"""
+
+import argparse
+
+import config
+from wxcloudrun import app
+from wxcloudrun.change_feed import prune_change_log
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='删除超出保留期限的变更日志')
+    parser.add_argument('--dry-run', action='store_true', help='只统计可删除的条数，不修改数据库')
+    parser.add_argument('--days', type=float, default=config.CHANGE_LOG_RETENTION_DAYS, help='保留天数')
+    parser.add_argument('--rows', type=int, default=config.CHANGE_LOG_RETENTION_ROWS, help='最多保留的条数')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的条数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with app.app_context():
+        pruned = prune_change_log(args.days, args.rows, args.batch_size, args.dry_run)
+    print(f"{'可删除' if args.dry_run else '已删除'}变更日志 {pruned} 条")
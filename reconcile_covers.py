@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+封面图片COS与数据库对账脚本
+分页列出COS中covers/前缀下的对象，同时按相同顺序流式读取cover_picture表的图片名称，
+归并比较两侧，找出没有数据库记录的COS对象和对象已不存在的数据库记录。
+两侧都按顺序流式处理，内存占用与对象数量无关；修复时按批删除。
+同时清理超过有效期仍未完成的直传任务，删除它们在uploads/下的原图。
+
+用法:
+    python reconcile_covers.py [--repair] [--min-age 3600] [--page-size 1000]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from wxcloudrun import app
+from wxcloudrun.cos_client import cos_client
+from wxcloudrun.dao import delete_cover_pictures_by_names, stream_cover_picture_names
+from wxcloudrun.direct_upload import expire_stale_uploads
+
+COVER_PREFIX = 'covers/'
+
+# COS批量删除单次请求的对象数上限
+COS_DELETE_BATCH = 1000
+
+
+class OrderError(Exception):
+    """某一侧的名称不是严格递增的，归并结果不可信"""
+
+
+def parse_last_modified(value):
+    """解析COS返回的LastModified，如 2024-12-16T12:34:56.000Z"""
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+
+def iter_cos_objects(prefix, page_size, stats):
+    """
+    逐页列出对象，处理当前页时在后台请求下一页
+    :return: 生成器，产生(图片名称, 最后修改时间字符串)，时间只在需要时解析
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(cos_client.list_objects, prefix, '', page_size)
+        while future is not None:
+            objects, marker = future.result()
+            stats['list_requests'] += 1
+            future = pool.submit(cos_client.list_objects, prefix, marker, page_size) if marker else None
+            for obj in objects:
+                yield obj['Key'][len(prefix):], obj['LastModified']
+
+
+def ordered(items, side):
+    """检查名称严格递增，顺序不一致时中止，避免误删"""
+    previous = None
+    for item in items:
+        if previous is not None and item[0] <= previous:
+            raise OrderError(f'{side}的名称顺序不一致: {previous!r} -> {item[0]!r}')
+        previous = item[0]
+        yield item
+
+
+def merge_join(cos_items, db_items):
+    """
+    归并两个按名称递增的序列
+    :return: 生成器，产生(图片名称, COS对象最后修改时间或None, 数据库记录创建时间或None)
+    """
+    cos_item, db_item = next(cos_items, None), next(db_items, None)
+    while cos_item is not None or db_item is not None:
+        if db_item is None or (cos_item is not None and cos_item[0] < db_item[0]):
+            yield cos_item[0], cos_item[1], None
+            cos_item = next(cos_items, None)
+        elif cos_item is None or db_item[0] < cos_item[0]:
+            yield db_item[0], None, db_item[1]
+            db_item = next(db_items, None)
+        else:
+            yield cos_item[0], cos_item[1], db_item[1]
+            cos_item, db_item = next(cos_items, None), next(db_items, None)
+
+
+class Repairer:
+    """累积待删除的孤儿，满一批时删除"""
+
+    def __init__(self, repair, batch_size, stats):
+        self.repair = repair
+        self.batch_size = batch_size
+        self.stats = stats
+        self.cos_keys = []
+        self.db_names = []
+
+    def add_cos_orphan(self, picture_name):
+        self.cos_keys.append(COVER_PREFIX + picture_name)
+        if len(self.cos_keys) >= min(self.batch_size, COS_DELETE_BATCH):
+            self.flush_cos()
+
+    def add_db_orphan(self, picture_name):
+        self.db_names.append(picture_name)
+        if len(self.db_names) >= self.batch_size:
+            self.flush_db()
+
+    def flush_cos(self):
+        if self.repair and self.cos_keys:
+            failed = cos_client.delete_objects(self.cos_keys)
+            self.stats['delete_requests'] += 1
+            self.stats['cos_deleted'] += len(self.cos_keys) - len(failed)
+        self.cos_keys = []
+
+    def flush_db(self):
+        if self.repair and self.db_names:
+            self.stats['db_deleted'] += delete_cover_pictures_by_names(self.db_names)
+        self.db_names = []
+
+    def flush(self):
+        self.flush_cos()
+        self.flush_db()
+
+
+def reconcile(repair, min_age, page_size, batch_size, progress_every):
+    stats = {
+        'cos_objects': 0, 'db_rows': 0, 'matched': 0,
+        'cos_orphans': 0, 'db_orphans': 0, 'skipped_recent': 0,
+        'list_requests': 0, 'delete_requests': 0, 'cos_deleted': 0, 'db_deleted': 0
+    }
+    # 最近写入的对象或记录可能属于正在进行的上传，不视为孤儿
+    cos_cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age)
+    db_cutoff = datetime.now() - timedelta(seconds=min_age)
+    start = time.perf_counter()
+
+    with app.app_context():
+        repairer = Repairer(repair, batch_size, stats)
+        cos_items = ordered(iter_cos_objects(COVER_PREFIX, page_size, stats), 'COS')
+        db_items = ordered(stream_cover_picture_names(page_size), '数据库')
+
+        for compared, (picture_name, last_modified, created_at) in enumerate(merge_join(cos_items, db_items), 1):
+            stats['cos_objects'] += last_modified is not None
+            stats['db_rows'] += created_at is not None
+            if last_modified is not None and created_at is not None:
+                stats['matched'] += 1
+            elif created_at is None:
+                if parse_last_modified(last_modified) > cos_cutoff:
+                    stats['skipped_recent'] += 1
+                else:
+                    stats['cos_orphans'] += 1
+                    print(f"COS孤儿对象: {COVER_PREFIX}{picture_name}")
+                    repairer.add_cos_orphan(picture_name)
+            else:
+                if created_at > db_cutoff:
+                    stats['skipped_recent'] += 1
+                else:
+                    stats['db_orphans'] += 1
+                    print(f"数据库孤儿记录: {picture_name}")
+                    repairer.add_db_orphan(picture_name)
+
+            if progress_every and compared % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"已比较 COS {stats['cos_objects']} 个，数据库 {stats['db_rows']} 条，"
+                      f"{compared / elapsed:.0f} 个名称/秒")
+        repairer.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n完成: COS对象 {stats['cos_objects']} 个，数据库记录 {stats['db_rows']} 条，一致 {stats['matched']} 个，"
+          f"耗时 {elapsed:.1f} 秒")
+    print(f"COS孤儿对象 {stats['cos_orphans']} 个，数据库孤儿记录 {stats['db_orphans']} 条，"
+          f"跳过最近写入 {stats['skipped_recent']} 个")
+    print(f"列表请求 {stats['list_requests']} 次，批量删除请求 {stats['delete_requests']} 次")
+    if repair:
+        print(f"已删除COS对象 {stats['cos_deleted']} 个，数据库记录 {stats['db_deleted']} 条")
+    else:
+        print("未修改任何数据，使用 --repair 删除孤儿")
+    return stats
+
+
+def expire_uploads(repair, batch_size):
+    with app.app_context():
+        stats = expire_stale_uploads(repair, batch_size)
+    if repair:
+        print(f"过期直传任务 {stats['stale']} 个，已标记失败 {stats['expired']} 个，删除原图 {stats['deleted']} 个")
+    else:
+        print(f"过期直传任务 {stats['stale']} 个，使用 --repair 标记失败并删除原图")
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='对账COS中的封面图片和cover_picture表')
+    parser.add_argument('--repair', action='store_true', help='删除两侧的孤儿，默认只输出报告')
+    parser.add_argument('--min-age', type=int, default=3600, help='只处理早于该秒数写入的对象和记录')
+    parser.add_argument('--page-size', type=int, default=1000, help='每页列出的对象数(最大1000)和游标每次读取的行数')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批删除的数量')
+    parser.add_argument('--progress-every', type=int, default=100000, help='每比较多少项输出一次进度，0表示不输出')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.page_size = min(args.page_size, 1000)
+    print(f"开始对账封面图片{'并修复' if args.repair else ''}...")
+    reconcile(args.repair, args.min_age, args.page_size, args.batch_size, args.progress_every)
+    expire_uploads(args.repair, args.batch_size)
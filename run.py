@@ -1,8 +1,14 @@
 # 创建应用实例
+import os
 import sys
 
 from wxcloudrun import app
+from wxcloudrun.warmup import start_warmup
 
 # 启动Flask Web服务
 if __name__ == '__main__':
+    # 后台预热，完成前就绪探针返回503。开启reloader时只在实际处理请求的子进程中预热，
+    # 负责监视文件变化的父进程不处理请求
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
     app.run(host=sys.argv[1], port=sys.argv[2])
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+# 测试使用SQLite和本地存储，环境变量需要在导入wxcloudrun之前设置
+TEST_DIR = tempfile.mkdtemp(prefix='yesidosvc_test_')
+os.environ.update({
+    'STORAGE_BACKEND': 'local',
+    'LOCAL_STORAGE_DIR': os.path.join(TEST_DIR, 'storage'),
+    'RATE_LIMIT_ENABLED': 'false',
+    'RATE_LIMIT_STORE_PATH': os.path.join(TEST_DIR, 'ratelimit'),
+    'ACCESS_LOG_ENABLED': 'false',
+    'IMAGE_PROCESS_WORKERS': '0',
+    'MYSQL_REPLICA_ADDRESSES': ''
+})
+
+import config  # noqa: E402
+from wxcloudrun import app, db  # noqa: E402
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(TEST_DIR, 'test.db')
+app.config['TESTING'] = True
+
+ADMIN_HEADERS = {'Admin-Secret': config.ADMIN_SECRET}
+
+
+def reset_database():
+    """
+    重建主库的全部表
+    """
+    with app.app_context():
+        db.drop_all(bind=None)
+        db.create_all(bind=None)
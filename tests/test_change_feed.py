@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy.orm import Session
+
+from tests import reset_database
+from wxcloudrun import app, db
+from wxcloudrun import change_feed
+from wxcloudrun.change_feed import change_notifier, prune_change_log
+from wxcloudrun.model import ChangeLog, CoverPicture
+
+
+class ChangeFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        reset_database()
+        change_notifier._versions = None
+        change_notifier._settled = 0
+        change_notifier._settled_versions = {}
+        self.client = app.test_client()
+
+    def changes(self, **params):
+        return self.client.get('/api/changes', query_string=dict(params, timeout=0))
+
+    def write_from_other_instance(self):
+        # 使用独立的会话写入，不触发本进程的变更通知，版本号缓存不会更新
+        now = datetime.now()
+        with app.app_context():
+            with Session(db.engine) as session:
+                cover_picture = CoverPicture(picture_name='a.png', file_url='cloud://a.png', primary_cover=False,
+                                             created_at=now, updated_at=now)
+                session.add(cover_picture)
+                session.flush()
+                session.add(ChangeLog(topic='cover', entity_id=cover_picture.id, operation='INSERT', created_at=now))
+                session.commit()
+
+    def write_change_logs(self, ids, created_at=None):
+        now = created_at or datetime.now()
+        with app.app_context():
+            with Session(db.engine) as session:
+                session.add_all([ChangeLog(id=change_id, topic='cover', entity_id=change_id, operation='DELETE',
+                                           created_at=now) for change_id in ids])
+                session.commit()
+
+    def test_version_from_other_instance_is_not_reset(self):
+        self.assertEqual(self.changes().get_json()['data']['version'], 0)
+        self.write_from_other_instance()
+
+        data = self.changes(since=1).get_json()['data']
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['version'], 1)
+
+    def test_version_ahead_of_database_is_rejected(self):
+        self.write_from_other_instance()
+        response = self.changes(since=5)
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_waiters_share_one_settle_check_across_gap(self):
+        self.write_change_logs([1])
+        self.assertEqual(self.changes().get_json()['data']['version'], 1)
+        # 版本2尚未提交，版本3在缺口到期前不能下发
+        self.write_change_logs([3])
+
+        calls = []
+        query_changes = change_feed.query_changes
+
+        def counted_query_changes(since, limit):
+            calls.append(threading.current_thread().name)
+            return query_changes(since, limit)
+
+        results = []
+
+        def poll():
+            client = app.test_client()
+            results.append(client.get('/api/changes', query_string={'since': 1, 'timeout': 5}).get_json()['data'])
+
+        started = time.monotonic()
+        with mock.patch.object(change_notifier, 'settle_seconds', 0.5), \
+                mock.patch.object(change_notifier, 'poll_interval', 10), \
+                mock.patch.object(change_feed, 'query_changes', side_effect=counted_query_changes):
+            threads = [threading.Thread(target=poll, name=f'waiter-{i}') for i in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([data['version'] for data in results], [3] * 10)
+        self.assertLess(time.monotonic() - started, 3)
+        # 缺口期间只有后台线程查询变更日志，等待者只在返回增量时各查询一次
+        poller_calls = [name for name in calls if name == 'change-feed-poller']
+        self.assertLessEqual(len(poller_calls), 3)
+        self.assertEqual(len(calls) - len(poller_calls), 10)
+
+    def test_gap_before_settle_window_is_held_back(self):
+        self.write_change_logs([1])
+        self.assertEqual(self.changes().get_json()['data']['version'], 1)
+        self.write_change_logs([3])
+        with mock.patch.object(change_notifier, 'settle_seconds', 60):
+            data = self.changes(since=1).get_json()['data']
+        self.assertEqual(data['version'], 1)
+        # 版本2提交后缺口补上，两个版本一起下发
+        self.write_change_logs([2])
+        with mock.patch.object(change_notifier, 'settle_seconds', 60):
+            data = self.client.get('/api/changes', query_string={'since': 1, 'timeout': 2}).get_json()['data']
+        self.assertEqual(data['version'], 3)
+        self.assertEqual(data['changes']['cover']['removed'], [2, 3])
+
+
+    def remaining_ids(self):
+        with app.app_context():
+            return [row.id for row in ChangeLog.query.order_by(ChangeLog.id)]
+
+    def test_prune_keeps_latest_rows(self):
+        self.write_change_logs(range(1, 11))
+        with app.app_context():
+            self.assertEqual(prune_change_log(7, 3, batch_size=2, dry_run=True), 7)
+            self.assertEqual(prune_change_log(7, 3, batch_size=2), 7)
+        self.assertEqual(self.remaining_ids(), [8, 9, 10])
+
+    def test_prune_by_age_always_keeps_latest(self):
+        self.write_change_logs(range(1, 5), created_at=datetime.now() - timedelta(days=10))
+        self.write_change_logs([5, 6])
+        with app.app_context():
+            self.assertEqual(prune_change_log(7, 100), 4)
+        self.assertEqual(self.remaining_ids(), [5, 6])
+
+        self.write_change_logs([7], created_at=datetime.now() - timedelta(days=10))
+        with app.app_context():
+            prune_change_log(0, 0)
+        self.assertEqual(self.remaining_ids(), [7])
+
+    def test_since_before_pruned_range_is_reset(self):
+        self.write_change_logs(range(1, 11), created_at=datetime.now() - timedelta(minutes=1))
+        with app.app_context():
+            prune_change_log(7, 3)
+
+        data = self.changes(since=2).get_json()['data']
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['version'], 10)
+
+        data = self.changes(since=7).get_json()['data']
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['version'], 10)
+        self.assertEqual(data['changes']['cover']['removed'], [8, 9, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import io
+import os
+import unittest
+from unittest import mock
+
+import config
+from tests import ADMIN_HEADERS, reset_database
+from tests.test_round_trips import make_png
+from wxcloudrun import app
+
+
+class CoverUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        reset_database()
+        self.client = app.test_client()
+
+    def upload(self, filename, color):
+        return self.client.post('/api/cover/upload', headers=ADMIN_HEADERS, data={
+            'file': (io.BytesIO(make_png(color)), filename)
+        })
+
+    def object_path(self, picture_name):
+        return os.path.join(config.LOCAL_STORAGE_DIR, config.COS_BUCKET_NAME, 'covers', picture_name)
+
+    def test_duplicate_name_keeps_existing_object(self):
+        first = self.upload('b.png', 'red').get_json()
+        self.assertEqual(first['code'], 0)
+        with open(self.object_path('b.png'), 'rb') as f:
+            stored = f.read()
+
+        second = self.upload('b.png', 'blue').get_json()
+        self.assertNotEqual(second['code'], 0)
+
+        # 已有记录引用的对象既不能被覆盖，也不能被删除
+        with open(self.object_path('b.png'), 'rb') as f:
+            self.assertEqual(f.read(), stored)
+        pictures = self.client.get('/api/cover/list', headers=ADMIN_HEADERS).get_json()['data']['pictures']
+        self.assertEqual([picture['picture_name'] for picture in pictures], ['b.png'])
+
+    def test_insert_conflict_does_not_delete_object(self):
+        self.assertEqual(self.upload('b.png', 'red').get_json()['code'], 0)
+
+        # 两个同名上传同时通过查重时，插入失败的请求不能删除另一个请求的记录引用的对象
+        with mock.patch('wxcloudrun.views.cover_name_exists', return_value=False), \
+                mock.patch('wxcloudrun.views.cos_client.delete_cover_image_async') as delete:
+            second = self.upload('b.png', 'blue').get_json()
+        self.assertNotEqual(second['code'], 0)
+        delete.assert_not_called()
+        self.assertTrue(os.path.exists(self.object_path('b.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+
+from tests import ADMIN_HEADERS, reset_database
+from wxcloudrun import app
+from wxcloudrun.dao import db_breaker, insert_user, unit_of_work
+from wxcloudrun.model import User
+from wxcloudrun.resilience import CircuitBreaker
+
+
+class UnitOfWorkBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        reset_database()
+        self.client = app.test_client()
+        # 打开熔断器并立即进入半开状态
+        patcher = mock.patch.object(db_breaker, 'reset_timeout', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(db_breaker.record_success)
+        for _ in range(db_breaker.failure_threshold):
+            db_breaker.record_failure()
+
+    def user(self, userid):
+        return User(userid=userid, user_name=userid, role='user')
+
+    def test_error_without_sql_releases_probe(self):
+        with app.app_context():
+            with self.assertRaises(ValueError):
+                with unit_of_work():
+                    raise ValueError('业务校验失败')
+        # 没有访问数据库，不能据此关闭熔断器，但下一个调用可以继续探测
+        self.assertEqual(db_breaker.stats()['state'], CircuitBreaker.HALF_OPEN)
+        self.assertTrue(db_breaker.allow())
+
+    def test_error_after_sql_closes_breaker(self):
+        db_breaker.record_success()
+        with app.app_context():
+            with unit_of_work():
+                insert_user(self.user('u1'))
+        for _ in range(db_breaker.failure_threshold):
+            db_breaker.record_failure()
+        with app.app_context():
+            with self.assertRaises(IntegrityError):
+                with unit_of_work():
+                    insert_user(self.user('u1'))
+        self.assertEqual(db_breaker.stats()['state'], CircuitBreaker.CLOSED)
+
+    def test_views_share_unavailable_handler(self):
+        # 半开状态的探测名额被占用时，接口由统一的错误处理返回503
+        self.assertTrue(db_breaker.allow())
+        response = self.client.get('/api/users', headers=ADMIN_HEADERS)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['errorMsg'], '数据库暂不可用，请稍后重试')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import config
+from tests import ADMIN_HEADERS, reset_database
+from tests.test_round_trips import make_png
+from wxcloudrun import app, db
+from wxcloudrun.cos_client import cos_client
+from wxcloudrun.direct_upload import expire_stale_uploads
+from wxcloudrun.model import CoverUpload
+
+
+class DirectUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        reset_database()
+        self.client = app.test_client()
+        # 后台处理在当前线程中同步执行
+        patcher = mock.patch('wxcloudrun.direct_upload.cos_executor.submit',
+                             side_effect=lambda fn, *args: fn(*args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_upload(self, data):
+        response = self.client.post('/api/cover/upload/presign', json={'filename': 'a.png'},
+                                    headers=ADMIN_HEADERS).get_json()
+        upload_id = response['data']['upload_id']
+        with app.app_context():
+            object_key = CoverUpload.query.filter_by(upload_id=upload_id).one().object_key
+        cos_client.client.put_object(Bucket=cos_client.bucket, Body=data, Key=object_key)
+        return upload_id
+
+    def finalize(self, upload_id):
+        return self.client.post(f'/api/cover/upload/{upload_id}/finalize', headers=ADMIN_HEADERS).get_json()['data']
+
+    def object_exists(self, upload_id):
+        with app.app_context():
+            object_key = CoverUpload.query.filter_by(upload_id=upload_id).one().object_key
+        return os.path.exists(os.path.join(config.LOCAL_STORAGE_DIR, cos_client.bucket, object_key))
+
+    def set_created(self, upload_id, created_at):
+        with app.app_context():
+            CoverUpload.query.filter_by(upload_id=upload_id).update({CoverUpload.created_at: created_at})
+            db.session.commit()
+
+    def set_processing(self, upload_id, updated_at):
+        with app.app_context():
+            CoverUpload.query.filter_by(upload_id=upload_id).update(
+                {CoverUpload.status: 'PROCESSING', CoverUpload.updated_at: updated_at})
+            db.session.commit()
+
+    def test_oversized_object_is_rejected_before_download(self):
+        upload_id = self.create_upload(b'x' * 100)
+        with mock.patch.object(config, 'DIRECT_UPLOAD_MAX_BYTES', 10), \
+                mock.patch.object(cos_client, 'download_object') as download:
+            result = self.finalize(upload_id)
+        download.assert_not_called()
+        self.assertEqual(result['status'], 'FAILED')
+        # 失败是终态，原图随即删除
+        self.assertFalse(self.object_exists(upload_id))
+        self.assertEqual(self.finalize(upload_id)['status'], 'FAILED')
+
+    def test_transient_failure_can_be_finalized_again(self):
+        upload_id = self.create_upload(make_png())
+        with mock.patch.object(cos_client, 'download_object', side_effect=OSError('存储暂时不可用')):
+            result = self.finalize(upload_id)
+        self.assertEqual(result['status'], 'PENDING')
+        self.assertTrue(self.object_exists(upload_id))
+        self.assertEqual(self.finalize(upload_id)['status'], 'DONE')
+        self.assertFalse(self.object_exists(upload_id))
+
+    def test_stale_uploads_are_expired(self):
+        stale = self.create_upload(make_png())
+        fresh = self.create_upload(make_png())
+        stuck = self.create_upload(make_png())
+        age = timedelta(seconds=config.DIRECT_UPLOAD_EXPIRES + config.DIRECT_UPLOAD_LEASE_SECONDS + 1)
+        self.set_created(stale, datetime.now() - age)
+        self.set_created(stuck, datetime.now() - age)
+        # 刚被重新抢占的处理中任务按抢占时间判断，不会被清理
+        self.set_processing(stuck, datetime.now().replace(microsecond=0))
+
+        with app.app_context():
+            self.assertEqual(expire_stale_uploads(repair=False)['stale'], 1)
+            self.assertEqual(expire_stale_uploads(batch_size=1), {'stale': 1, 'expired': 1, 'deleted': 1})
+
+        self.assertFalse(self.object_exists(stale))
+        self.assertTrue(self.object_exists(fresh))
+        self.assertTrue(self.object_exists(stuck))
+        self.assertEqual(self.finalize(stale)['status'], 'FAILED')
+        self.assertEqual(self.finalize(fresh)['status'], 'DONE')
+
+    def test_expired_processing_upload_is_claimed_again(self):
+        upload_id = self.create_upload(make_png())
+        lease = timedelta(seconds=config.DIRECT_UPLOAD_LEASE_SECONDS)
+
+        # 租约内的处理中任务不会被重复提交
+        self.set_processing(upload_id, datetime.now().replace(microsecond=0))
+        self.assertEqual(self.finalize(upload_id)['status'], 'PROCESSING')
+
+        # 处理者异常退出，租约过期后重新提交处理
+        self.set_processing(upload_id, datetime.now().replace(microsecond=0) - lease - timedelta(seconds=1))
+        self.assertEqual(self.finalize(upload_id)['status'], 'DONE')
+
+    def test_result_is_discarded_after_lease_is_lost(self):
+        upload_id = self.create_upload(make_png())
+        original_upload = cos_client.upload_cover_image
+
+        def reclaimed_while_processing(*args, **kwargs):
+            # 模拟处理超过租约期间任务被其他处理者重新抢占
+            self.set_processing(upload_id, datetime.now().replace(microsecond=0) + timedelta(seconds=5))
+            return original_upload(*args, **kwargs)
+
+        with mock.patch.object(cos_client, 'upload_cover_image', side_effect=reclaimed_while_processing):
+            self.assertEqual(self.finalize(upload_id)['status'], 'PROCESSING')
+        covers = self.client.get('/api/cover/list', headers=ADMIN_HEADERS).get_json()['data']['pictures']
+        self.assertEqual(covers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import config
+from wxcloudrun.image_processing import encode_cover_image, encode_with_budget
+
+
+def make_photo(width, height):
+    # 噪声图片压缩率低，质量对输出大小影响明显
+    return Image.merge('RGB', [Image.effect_noise((width, height), sigma) for sigma in (30, 45, 60)])
+
+
+class EncodeWithBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = make_photo(400, 300)
+
+    def assertQualityInRange(self, quality):
+        self.assertGreaterEqual(quality, config.IMAGE_QUALITY_MIN)
+        self.assertLessEqual(quality, config.IMAGE_QUALITY_MAX)
+
+    def test_stays_within_budget(self):
+        for format in ('JPEG', 'WEBP'):
+            with self.subTest(format=format):
+                # 预算取最低质量和最高质量输出大小的中间值，确保二分查找有意义
+                smallest, _ = encode_with_budget(self.image, format, 1)
+                largest, _ = encode_with_budget(self.image, format, 0)
+                budget = (len(smallest) + len(largest)) // 2
+                data, quality = encode_with_budget(self.image, format, budget)
+                self.assertLessEqual(len(data), budget)
+                self.assertQualityInRange(quality)
+                self.assertEqual(Image.open(io.BytesIO(data)).format, format)
+
+    def test_picks_highest_quality_within_budget(self):
+        _, quality = encode_with_budget(self.image, 'JPEG', 40 * 1024)
+        self.assertLess(quality, config.IMAGE_QUALITY_MAX)
+        # 只允许更高的质量时，最低的一档也超出预算
+        with mock.patch.object(config, 'IMAGE_QUALITY_MIN', quality + 1):
+            data, higher = encode_with_budget(self.image, 'JPEG', 40 * 1024)
+        self.assertEqual(higher, quality + 1)
+        self.assertGreater(len(data), 40 * 1024)
+
+    def test_unreachable_budget_stops_at_minimum_quality(self):
+        data, quality = encode_with_budget(self.image, 'JPEG', 1024)
+        self.assertEqual(quality, config.IMAGE_QUALITY_MIN)
+        self.assertGreater(len(data), 1024)
+
+    def test_zero_budget_uses_maximum_quality(self):
+        _, quality = encode_with_budget(self.image, 'JPEG', 0)
+        self.assertEqual(quality, config.IMAGE_QUALITY_MAX)
+
+    def test_cover_image_within_configured_budget(self):
+        buffer = io.BytesIO()
+        make_photo(2400, 1600).save(buffer, format='JPEG', quality=95)
+        with mock.patch.object(config, 'IMAGE_BYTE_BUDGET', 200 * 1024):
+            data, format = encode_cover_image(buffer.getvalue())
+        self.assertEqual(format, 'JPEG')
+        self.assertLessEqual(len(data), 200 * 1024)
+        self.assertEqual(max(Image.open(io.BytesIO(data)).size), 1440)
+
+
+if __name__ == '__main__':
+    unittest.main()
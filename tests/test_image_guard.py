@@ -0,0 +1,43 @@
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import config
+from wxcloudrun.image_guard import ImageRejectedError, inspect_image
+
+
+def make_image(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class PixelLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [mock.patch.object(config, 'IMAGE_MAX_PIXELS', 100),
+                    mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertRejected(self, width, height):
+        with self.assertRaises(ImageRejectedError) as cm:
+            inspect_image(make_image(width, height))
+        self.assertEqual(cm.exception.reason, 'pixels')
+
+    def test_within_limit(self):
+        self.assertEqual(inspect_image(make_image(10, 10))['width'], 10)
+
+    def test_between_limit_and_double_is_rejected(self):
+        # PIL在这个区间只给出警告，需要由inspect_image拒绝
+        self.assertRejected(12, 12)
+
+    def test_above_double_limit_is_rejected(self):
+        self.assertRejected(15, 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
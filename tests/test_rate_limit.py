@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+import config
+from tests import reset_database
+from wxcloudrun import app
+from wxcloudrun.rate_limit import get_client_identity
+
+
+class ClientIdentityTest(unittest.TestCase):
+
+    def identity(self, headers):
+        with app.test_request_context('/api/count', headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            return get_client_identity()
+
+    def test_gateway_openid_is_trusted(self):
+        headers = {'X-WX-SOURCE': 'wx_client', 'X-WX-OPENID': 'o-abc'}
+        self.assertEqual(self.identity(headers), 'openid:o-abc')
+
+    def test_spoofed_openid_falls_back_to_ip(self):
+        self.assertEqual(self.identity({'X-WX-OPENID': 'o-abc'}), 'ip:10.0.0.1')
+        headers = {'X-WX-OPENID': 'o-abc', 'X-Forwarded-For': '1.1.1.1, 203.0.113.7'}
+        self.assertEqual(self.identity(headers), 'ip:203.0.113.7')
+
+    def test_rotating_spoofed_openid_is_still_limited(self):
+        reset_database()
+        client = app.test_client()
+        statuses = []
+        with mock.patch.object(config, 'RATE_LIMIT_ENABLED', True):
+            for i in range(config.RATE_LIMIT_COUNT_BURST + 1):
+                response = client.post('/api/count', json={'action': 'inc'}, headers={
+                    'X-WX-OPENID': f'spoofed-{i}',
+                    'X-Forwarded-For': '198.51.100.9'
+                })
+                statuses.append(response.status_code)
+        self.assertNotIn(429, statuses[:-1])
+        self.assertEqual(statuses[-1], 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import unittest
+from unittest import mock
+
+from tests import ADMIN_HEADERS, TEST_DIR, reset_database
+from wxcloudrun import app, db, replica_router
+from wxcloudrun.db_routing import WRITE_TOKEN_HEADER
+from wxcloudrun.resilience import CircuitBreaker
+
+REPLICA_PATH = os.path.join(TEST_DIR, 'replica.db')
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+    """
+    主库和从库是两个独立的SQLite文件，没有复制，能从结果判断读操作落在哪个库
+    """
+
+    def setUp(self):
+        reset_database()
+        binds = mock.patch.dict(app.config, {'SQLALCHEMY_BINDS': {'replica_0': 'sqlite:///' + REPLICA_PATH}})
+        binds.start()
+        self.addCleanup(binds.stop)
+        replica_router.configure(['replica_0'])
+        self.addCleanup(replica_router.configure, [])
+        with app.app_context():
+            engine = db.get_engine(app, 'replica_0')
+            db.Model.metadata.drop_all(engine)
+            db.Model.metadata.create_all(engine)
+        self.client = app.test_client()
+
+    def list_userids(self, client, headers=None):
+        response = client.get('/api/users', headers={**ADMIN_HEADERS, **(headers or {})}).get_json()
+        return [user['userid'] for user in response['data']['users']]
+
+    def create_user(self, userid):
+        response = self.client.post('/api/users', headers=ADMIN_HEADERS,
+                                    json={'userid': userid, 'user_name': userid})
+        self.assertEqual(response.get_json()['code'], 0)
+        return response
+
+    def simulate_other_instance(self):
+        # 其他实例没有本进程记录的写入时间
+        replica_router._last_write = None
+
+    def test_reads_go_to_replica_without_recent_write(self):
+        self.create_user('u1')
+        self.simulate_other_instance()
+        self.assertEqual(self.list_userids(app.test_client()), [])
+
+    def test_write_token_routes_reads_to_primary_on_any_instance(self):
+        token = self.create_user('u1').headers[WRITE_TOKEN_HEADER]
+        self.simulate_other_instance()
+        # 测试客户端保存了Cookie
+        self.assertEqual(self.list_userids(self.client), ['u1'])
+        # 不支持Cookie的客户端通过请求头带回令牌
+        self.assertEqual(self.list_userids(app.test_client(), {WRITE_TOKEN_HEADER: token}), ['u1'])
+
+    def test_forged_or_expired_token_is_ignored(self):
+        token = self.create_user('u1').headers[WRITE_TOKEN_HEADER]
+        self.simulate_other_instance()
+        written_at, _, signature = token.rpartition('.')
+        forged = f'{float(written_at) + 60:.3f}.{signature}'
+        self.assertEqual(self.list_userids(app.test_client(), {WRITE_TOKEN_HEADER: forged}), [])
+        with mock.patch.object(replica_router, 'read_your_writes_window', 0):
+            self.assertEqual(self.list_userids(app.test_client(), {WRITE_TOKEN_HEADER: token}), [])
+
+    def test_replica_failure_falls_back_to_primary(self):
+        self.create_user('u1')
+        self.simulate_other_instance()
+        with app.app_context():
+            db.Model.metadata.drop_all(db.get_engine(app, 'replica_0'))
+        # 从库查询失败后立即改读主库，从库熔断后后续读操作直接走主库
+        self.assertEqual(self.list_userids(app.test_client()), ['u1'])
+        self.assertEqual(replica_router.stats()['replicas']['replica_0']['state'], CircuitBreaker.OPEN)
+        self.assertEqual(self.list_userids(app.test_client()), ['u1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import unittest
+
+from PIL import Image
+from sqlalchemy import event
+
+from tests import ADMIN_HEADERS, reset_database
+from wxcloudrun import app, db
+
+
+def make_png(color='red'):
+    output = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(output, format='PNG')
+    return output.getvalue()
+
+
+class RoundTripTest(unittest.TestCase):
+    """
+    写接口的数据库往返次数(执行的语句数 + 提交次数)，用引擎事件统计，防止退回到重复查询和多次提交
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with app.app_context():
+            cls.engine = db.engine
+        cls.round_trips = 0
+        event.listen(cls.engine, 'before_cursor_execute', cls._count)
+        event.listen(cls.engine, 'commit', cls._count)
+
+    @classmethod
+    def tearDownClass(cls):
+        event.remove(cls.engine, 'before_cursor_execute', cls._count)
+        event.remove(cls.engine, 'commit', cls._count)
+
+    @classmethod
+    def _count(cls, *args):
+        cls.round_trips += 1
+
+    def setUp(self):
+        reset_database()
+        self.client = app.test_client()
+
+    def assertRoundTrips(self, request, budget):
+        """
+        :param request: 发起请求的函数
+        :param budget: 允许的最多往返次数
+        """
+        RoundTripTest.round_trips = 0
+        response = request()
+        round_trips = RoundTripTest.round_trips
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['code'], 0, response.get_json())
+        self.assertLessEqual(round_trips, budget)
+        return response
+
+    def create_user(self, userid):
+        response = self.client.post('/api/users', json={'userid': userid, 'user_name': userid},
+                                    headers=ADMIN_HEADERS)
+        return response.get_json()['data']['id']
+
+    def upload_cover(self, filename, primary_cover=False):
+        return self.client.post('/api/cover/upload', headers=ADMIN_HEADERS, data={
+            'file': (io.BytesIO(make_png()), filename),
+            'primary_cover': 'true' if primary_cover else 'false'
+        })
+
+    def test_count_increment(self):
+        # 查询 + 更新 + 提交
+        self.client.post('/api/count', json={'action': 'inc'})
+        self.assertRoundTrips(lambda: self.client.post('/api/count', json={'action': 'inc'}), 3)
+
+    def test_create_user(self):
+        # 查重 + 插入用户 + 变更日志 + 提交
+        self.assertRoundTrips(lambda: self.client.post(
+            '/api/users', json={'userid': 'u1', 'user_name': 'a'}, headers=ADMIN_HEADERS), 4)
+
+    def test_update_user(self):
+        # 查询 + 更新用户 + 变更日志 + 提交
+        user_id = self.create_user('u1')
+        self.assertRoundTrips(lambda: self.client.put(
+            f'/api/users/{user_id}', json={'user_name': 'b'}, headers=ADMIN_HEADERS), 4)
+
+    def test_delete_user(self):
+        # 查询 + 变更日志 + 删除 + 提交
+        user_id = self.create_user('u1')
+        self.assertRoundTrips(lambda: self.client.delete(f'/api/users/{user_id}', headers=ADMIN_HEADERS), 4)
+
+    def test_upload_primary_cover(self):
+        # 名称查重 + 查询主封面 + 清除主封面 + 插入封面 + 两条变更日志 + 提交
+        self.upload_cover('a.png', primary_cover=True)
+        self.assertRoundTrips(lambda: self.upload_cover('b.png', primary_cover=True), 7)
+
+    def test_delete_cover(self):
+        # 查询 + 变更日志 + 删除 + 提交
+        self.upload_cover('a.png')
+        self.assertRoundTrips(lambda: self.client.delete('/api/cover/a.png', headers=ADMIN_HEADERS), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
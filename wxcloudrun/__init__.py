@@ -1,21 +1,51 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 import pymysql
 import config
+from wxcloudrun import logging_config
+from wxcloudrun.db_routing import ReplicaRouter, RoutingSQLAlchemy
 
 # 因MySQLDB不支持Python3，使用pymysql扩展库代替MySQLDB库
 pymysql.install_as_MySQLdb()
 
+# 日志经队列异步输出
+logging_config.configure_logging()
+
 # 初始化web应用
 app = Flask(__name__, instance_relative_config=True)
 app.config['DEBUG'] = config.DEBUG
+logging_config.init_app(app)
 
 # 设定数据库链接
 app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql://{}:{}@{}/flask_demo'.format(config.username, config.password,
                                                                              config.db_address)
 
-# 初始化DB操作对象
-db = SQLAlchemy(app)
+
+def _replica_uri(address):
+    """
+    :param address: 从库地址host:port；带协议的完整连接串原样使用，便于用SQLite等模拟从库
+    :return: 从库连接串
+    """
+    if '://' in address:
+        return address
+    return 'mysql://{}:{}@{}/flask_demo?connect_timeout={}'.format(
+        config.username, config.password, address, config.DB_REPLICA_CONNECT_TIMEOUT)
+
+
+# 只读从库，键为replica_0、replica_1...
+app.config['SQLALCHEMY_BINDS'] = {
+    'replica_{}'.format(index): _replica_uri(address)
+    for index, address in enumerate(config.DB_REPLICA_ADDRESSES)
+}
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_recycle': config.DB_POOL_RECYCLE,
+    'pool_pre_ping': config.DB_POOL_PRE_PING
+}
+
+# 初始化DB操作对象，只读操作可路由到从库
+db = RoutingSQLAlchemy(app)
+replica_router = ReplicaRouter(config.DB_REPLICA_FAILURE_THRESHOLD, config.DB_REPLICA_RESET_TIMEOUT,
+                               config.DB_READ_YOUR_WRITES_SECONDS, config.ADMIN_SECRET)
+replica_router.configure(app.config['SQLALCHEMY_BINDS'])
 
 # 加载控制器
 from wxcloudrun import views
@@ -0,0 +1,359 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import config
+from wxcloudrun import app, db
+from wxcloudrun.dao import (
+    delete_change_logs, query_change_id_bounds, query_change_versions, query_changes,
+    query_cover_pictures_by_ids, query_users_by_ids
+)
+from wxcloudrun.db_routing import RoutingSession
+from wxcloudrun.model import ChangeLog
+
+logger = logging.getLogger('log')
+
+# 支持订阅的主题及对应的批量查询
+TOPIC_QUERIES = {
+    'cover': query_cover_pictures_by_ids,
+    'user': query_users_by_ids
+}
+
+
+class ChangeFeedBusyError(Exception):
+    """等待中的长轮询请求过多"""
+
+
+class InvalidVersionError(Exception):
+    """客户端的版本号大于数据库中的最新版本，不是本服务下发的(如数据库已重建)"""
+
+
+class ChangeNotifier:
+    """
+    进程内的变更通知：记录各主题已提交的最新版本号和已稳定的版本号，长轮询请求在条件变量上等待。
+    版本号在插入时分配，但事务提交顺序可能不同，版本号不连续时缺口之后的变更要等缺口补上或超过
+    settle_seconds才算稳定，避免跳过之后才提交的较小版本。稳定版本由后台线程统一计算：
+    本进程提交写操作或等待者发现未稳定的新版本时立即计算一次，存在缺口时在缺口到期时再计算，
+    其余时间每隔poll_interval计算一次以发现其他实例或脚本写入的变更。等待者本身不查询数据库
+    """
+
+    def __init__(self, poll_interval, max_waiters, settle_seconds, scan_limit):
+        self.poll_interval = poll_interval
+        self.max_waiters = max_waiters
+        self.settle_seconds = settle_seconds
+        self.scan_limit = scan_limit
+        self._cond = threading.Condition()
+        self._versions = None
+        self._settled = 0
+        self._settled_versions = {}
+        # 后台计算时已读到的最大版本号，更大的版本出现时才需要提前计算
+        self._scanned = 0
+        self._waiters = 0
+        self._poller = None
+        self._recheck = threading.Event()
+
+    def _ensure_loaded(self):
+        if self._versions is None:
+            versions = query_change_versions()
+            with self._cond:
+                if self._versions is None:
+                    self._versions = versions
+                    self._skip_ahead()
+            self._settle()
+
+    def _skip_ahead(self):
+        """
+        稳定版本落后超过scan_limit时直接跳到最新版本前scan_limit处，更早的变更视为已稳定；
+        落后这么多的客户端会收到reset
+        """
+        floor = max(self._versions.values(), default=0) - self.scan_limit
+        if floor > self._settled:
+            self._settled = floor
+            for topic, version in self._versions.items():
+                if version <= floor:
+                    self._settled_versions[topic] = version
+
+    def publish(self, versions):
+        """
+        :param versions: {主题: 已提交的版本号}
+        """
+        with self._cond:
+            if self._versions is None:
+                return
+            changed = False
+            for topic, version in versions.items():
+                if version > self._versions.get(topic, 0):
+                    self._versions[topic] = version
+                    changed = True
+        if changed:
+            # 新版本需要确认稳定后才会唤醒等待者
+            self._recheck.set()
+
+    def refresh(self):
+        """
+        从数据库重新读取各主题的最新版本号。其他实例或脚本写入的变更只有本进程有等待者时才会被轮询到，
+        缓存的版本号可能落后
+        """
+        versions = query_change_versions()
+        with self._cond:
+            if self._versions is None:
+                self._versions = {}
+        self.publish(versions)
+
+    def current_version(self, topics=None):
+        """
+        :param topics: 主题列表，None表示全部主题
+        :return: 这些主题已提交的最新版本号
+        """
+        self._ensure_loaded()
+        with self._cond:
+            return self._version(self._versions, topics)
+
+    def settled_version(self):
+        """
+        :return: 已稳定的版本号，不大于它的变更都已提交或不会再出现
+        """
+        self._ensure_loaded()
+        with self._cond:
+            return self._settled
+
+    @staticmethod
+    def _version(versions, topics):
+        if topics is None:
+            return max(versions.values(), default=0)
+        return max((versions.get(topic, 0) for topic in topics), default=0)
+
+    def _settle(self):
+        """
+        从已稳定的版本号开始顺序读取变更日志，推进稳定版本并唤醒等待者
+        :return: 距下一次需要计算的秒数
+        """
+        with self._cond:
+            settled = self._settled
+        rows = query_changes(settled, self.scan_limit)
+        cutoff = datetime.now() - timedelta(seconds=self.settle_seconds)
+        delay = self.poll_interval
+        versions = {}
+        for row in rows:
+            if row.id != settled + 1 and row.created_at > cutoff:
+                # 缺口到期后再计算一次
+                delay = min(delay, max(0.0, (row.created_at - cutoff).total_seconds()))
+                break
+            settled = row.id
+            versions[row.topic] = row.id
+        else:
+            if len(rows) == self.scan_limit:
+                delay = 0
+
+        with self._cond:
+            if rows:
+                self._scanned = max(self._scanned, rows[-1].id)
+            for row in rows:
+                if row.id > self._versions.get(row.topic, 0):
+                    self._versions[row.topic] = row.id
+            if settled > self._settled:
+                self._settled = settled
+                for topic, version in versions.items():
+                    self._settled_versions[topic] = max(version, self._settled_versions.get(topic, 0))
+                self._cond.notify_all()
+        return delay
+
+    def wait(self, topics, since, timeout):
+        """
+        等待主题出现大于since的已稳定版本
+        :return: 是否有新版本，超时返回False
+        :raises ChangeFeedBusyError: 等待者已满
+        """
+        self._ensure_loaded()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._version(self._settled_versions, topics) > since:
+                return True
+            if self._waiters >= self.max_waiters:
+                raise ChangeFeedBusyError('等待中的请求过多')
+            self._waiters += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='change-feed-poller', daemon=True)
+                self._poller.start()
+            elif self._version(self._versions, topics) > max(since, self._scanned):
+                # 已知有后台线程尚未读到的新版本，让它立即计算，而不是等到下一个轮询周期
+                self._recheck.set()
+            try:
+                while self._version(self._settled_versions, topics) <= since:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._waiters -= 1
+
+    def _poll(self):
+        delay = 0
+        refresh = True
+        while True:
+            self._recheck.wait(delay)
+            self._recheck.clear()
+            with self._cond:
+                if self._waiters == 0:
+                    self._poller = None
+                    return
+            try:
+                with app.app_context():
+                    if refresh:
+                        # 空闲期间稳定版本可能已落后很多，启动时先读取最新版本号
+                        versions = query_change_versions()
+                        with self._cond:
+                            self._versions.update(
+                                {topic: version for topic, version in versions.items()
+                                 if version > self._versions.get(topic, 0)})
+                            self._skip_ahead()
+                        refresh = False
+                    delay = self._settle()
+                    db.session.remove()
+            except Exception as e:
+                logger.error(f"计算变更稳定版本失败: {str(e)}")
+                delay = self.poll_interval
+
+    def stats(self):
+        with self._cond:
+            return {
+                'versions': dict(self._versions or {}),
+                'settled_version': self._settled,
+                'waiters': self._waiters
+            }
+
+
+change_notifier = ChangeNotifier(config.CHANGE_FEED_POLL_INTERVAL, config.CHANGE_FEED_MAX_WAITERS,
+                                 config.CHANGE_FEED_SETTLE_SECONDS, config.CHANGE_FEED_MAX_CHANGES + 1)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_change_versions(session, flush_context):
+    for instance in session.new:
+        if isinstance(instance, ChangeLog):
+            versions = session.info.setdefault('change_versions', {})
+            versions[instance.topic] = max(versions.get(instance.topic, 0), instance.id)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _publish_change_versions(session):
+    versions = session.info.pop('change_versions', None)
+    if versions:
+        change_notifier.publish(versions)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_change_versions(session):
+    session.info.pop('change_versions', None)
+
+
+def _build_delta(topics, since, settled):
+    """
+    合并since之后、已稳定的变更：同一记录多次变更只返回最终结果，新增后又删除的记录不返回
+    :param settled: 已稳定的版本号
+    :return: 增量字典，变更过多时返回reset，客户端应重新拉取全量数据
+    """
+    rows = [row for row in query_changes(since, config.CHANGE_FEED_MAX_CHANGES + 1) if row.id <= settled]
+    if len(rows) > config.CHANGE_FEED_MAX_CHANGES:
+        return {'version': settled, 'reset': True, 'changes': {}}
+    # since之后的变更可能已被清理，只在版本号不连续时查询保留的最小版本号
+    if rows and rows[0].id > since + 1 and since + 1 < query_change_id_bounds()[0]:
+        return {'version': settled, 'reset': True, 'changes': {}}
+
+    first_ops, last_ops = {}, {}
+    for row in rows:
+        if row.topic in topics:
+            first_ops.setdefault((row.topic, row.entity_id), row.operation)
+            last_ops[(row.topic, row.entity_id)] = row.operation
+
+    changes = {}
+    for topic in topics:
+        added, changed, removed = [], [], []
+        for (row_topic, entity_id), operation in last_ops.items():
+            if row_topic != topic:
+                continue
+            inserted = first_ops[(row_topic, entity_id)] == 'INSERT'
+            if operation == 'DELETE':
+                if not inserted:
+                    removed.append(entity_id)
+            elif inserted:
+                added.append(entity_id)
+            else:
+                changed.append(entity_id)
+
+        # 查询时已被删除的记录跳过，对应的删除会在下一次增量中返回
+        items = {item.id: item for item in TOPIC_QUERIES[topic](added + changed)}
+        changes[topic] = {
+            'added': [items[entity_id] for entity_id in added if entity_id in items],
+            'changed': [items[entity_id] for entity_id in changed if entity_id in items],
+            'removed': removed
+        }
+
+    # 不大于settled的变更已全部包含在内，缺口对应的版本不会再出现
+    return {'version': settled, 'reset': False, 'changes': changes}
+
+
+def prune_change_log(max_age_days, max_rows, batch_size=1000, dry_run=False):
+    """
+    按版本号从旧到新删除超过保留天数或超出保留条数的变更，最新的一条总是保留，
+    用于判断客户端的版本号是否大于数据库中的最新版本。since早于保留的最小版本的客户端会收到reset
+    :param max_age_days: 保留天数
+    :param max_rows: 最多保留的条数
+    :param batch_size: 每批删除的条数
+    :param dry_run: 为True时只统计，不删除
+    :return: 删除(或试运行时可删除)的条数
+    """
+    oldest, latest = query_change_id_bounds()
+    if latest is None:
+        return 0
+    row_floor = latest - max_rows
+    age_cutoff = datetime.now() - timedelta(days=max_age_days)
+    pruned, since = 0, oldest - 1
+    while True:
+        rows = query_changes(since, batch_size)
+        ids = []
+        for row in rows:
+            # 版本号与写入时间基本同序，遇到第一条两个条件都不满足的变更即可停止
+            if row.id >= latest or (row.id > row_floor and row.created_at >= age_cutoff):
+                break
+            ids.append(row.id)
+        if not dry_run:
+            delete_change_logs(ids)
+        pruned += len(ids)
+        if len(ids) < batch_size:
+            return pruned
+        since = ids[-1]
+
+
+def poll_changes(topics, since, timeout):
+    """
+    长轮询：等待主题数据在since之后发生变化，返回增量
+    :param topics: 主题列表
+    :param since: 客户端已知的版本号，None表示首次订阅
+    :param timeout: 最长等待秒数
+    :return: {'version': 新版本号, 'reset': 是否需要重新拉取全量, 'changes': {主题: 增量}}
+    :raises ChangeFeedBusyError: 等待者已满
+    :raises InvalidVersionError: since大于数据库中的最新版本
+    """
+    current = change_notifier.current_version()
+    if since is not None and since > current:
+        # 客户端的版本号可能来自其他实例，本进程的缓存落后时先从数据库刷新
+        change_notifier.refresh()
+        current = change_notifier.current_version()
+        if since > current:
+            raise InvalidVersionError(f'版本号{since}大于最新版本{current}')
+
+    # 首次订阅时，客户端先拉取全量数据，再从已稳定的版本开始订阅，之后才提交的较小版本不会被跳过
+    if since is None:
+        return {'version': change_notifier.settled_version(), 'reset': True, 'changes': {}}
+
+    # 已有稳定的新变更时直接返回，否则在通知上等待，等待期间不占用数据库连接
+    if since >= change_notifier.settled_version():
+        db.session.close()
+        if not change_notifier.wait(topics, since, timeout):
+            return {'version': since, 'reset': False, 'changes': {}}
+    return _build_delta(topics, since, change_notifier.settled_version())
@@ -1,27 +1,46 @@
 from qcloud_cos import CosConfig
 from qcloud_cos import CosS3Client
-import io
-from PIL import Image
 import os
+import time
 import uuid
 from datetime import datetime
-from colorthief import ColorThief
 import config
 import logging
 import requests
+from wxcloudrun.dao import DatabaseUnavailableError
+from wxcloudrun.executor import BoundedExecutor, ExecutorSaturatedError, ExecutorTimeoutError
+from wxcloudrun.image_guard import ImageRejectedError
+from wxcloudrun.image_processing import (
+    FORMAT_EXTENSIONS, extract_major_color, process_cover_image_in_pool, resize_image
+)
+from wxcloudrun.local_storage import LocalStorageClient
 
 logger = logging.getLogger('log')
 
+# COS操作专用的有界执行器，避免存储延迟占满请求线程
+cos_executor = BoundedExecutor(
+    max_workers=config.COS_EXECUTOR_WORKERS,
+    queue_size=config.COS_EXECUTOR_QUEUE_SIZE,
+    thread_name_prefix='cos'
+)
+
 class COSClient:
     def __init__(self):
-        """初始化腾讯云COS客户端"""
-        cos_config = CosConfig(
-            Region=config.COS_REGION,
-            SecretId=config.COS_SECRET_ID,
-            SecretKey=config.COS_SECRET_KEY,
-            Scheme='https'
-        )
-        self.client = CosS3Client(cos_config)
+        """初始化腾讯云COS客户端，STORAGE_BACKEND为local时使用本地存储替身"""
+        self.local = config.STORAGE_BACKEND == 'local'
+        if self.local:
+            self.client = LocalStorageClient(
+                config.LOCAL_STORAGE_DIR, config.LOCAL_STORAGE_BASE_URL, config.LOCAL_STORAGE_SECRET
+            )
+        else:
+            cos_config = CosConfig(
+                Region=config.COS_REGION,
+                SecretId=config.COS_SECRET_ID,
+                SecretKey=config.COS_SECRET_KEY,
+                Scheme='https',
+                Timeout=config.COS_REQUEST_TIMEOUT
+            )
+            self.client = CosS3Client(cos_config)
         self.bucket = config.COS_BUCKET_NAME
 
     def get_file_meta(self, cos_key):
@@ -30,6 +49,9 @@ class COSClient:
         :param cos_key: 文件在COS中的路径
         :return: 元信息字典或None
         """
+        if self.local:
+            return {'respdata': {'x_cos_meta_field_strs': ['']}}
+
         url = 'http://api.weixin.qq.com/_/cos/metaid/encode'
 
         payload = {
@@ -39,7 +61,7 @@ class COSClient:
         }
 
         try:
-            response = requests.post(url, json=payload)
+            response = requests.post(url, json=payload, timeout=config.COS_REQUEST_TIMEOUT)
             response.raise_for_status()  # Raise error for bad status codes
             authres = response.json()
             return authres
@@ -53,28 +75,7 @@ class COSClient:
         :param image_data: 图片二进制数据
         :return: 十六进制颜色字符串，如 #FF5733
         """
-        try:
-            # 将图片数据保存到临时BytesIO对象
-            image_io = io.BytesIO(image_data)
-            
-            # 使用ColorThief提取主要颜色
-            color_thief = ColorThief(image_io)
-            dominant_color = color_thief.get_color(quality=1)
-
-            logger.error(f"提取的主要颜色RGB值: {dominant_color}")
-            
-            # 将RGB转换为十六进制
-            hex_color = "#{:02x}{:02x}{:02x}".format(
-                dominant_color[0], 
-                dominant_color[1], 
-                dominant_color[2]
-            )
-            
-            return hex_color
-            
-        except Exception as e:
-            logger.error(f"提取主要颜色失败: {str(e)}")
-            return "#FFFFFF"  # 默认返回白色
+        return extract_major_color(image_data)
     
     def resize_image(self, image_data, max_size=1440):
         """
@@ -83,62 +84,42 @@ class COSClient:
         :param max_size: 最大尺寸，默认1440px
         :return: 调整后的图片二进制数据
         """
-        try:
-            # 打开图片
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 获取原始尺寸
-            width, height = image.size
-            
-            # 如果图片尺寸已经符合要求，直接返回
-            if width <= max_size and height <= max_size:
-                return image_data
-            
-            # 计算新尺寸，保持宽高比
-            if width > height:
-                new_width = max_size
-                new_height = int(height * max_size / width)
-            else:
-                new_height = max_size
-                new_width = int(width * max_size / height)
-            
-            # 调整图片大小
-            resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 保存到内存
-            output = io.BytesIO()
-            # 保持原始格式，如果是JPEG则保存为JPEG，PNG则保存为PNG
-            format = image.format if image.format else 'JPEG'
-            if format == 'JPEG':
-                resized_image.save(output, format=format, quality=85, optimize=True)
-            else:
-                resized_image.save(output, format=format, optimize=True)
-            
-            return output.getvalue()
-            
-        except Exception as e:
-            logger.error(f"图片调整大小失败: {str(e)}")
-            return image_data  # 如果调整失败，返回原始数据
+        return resize_image(image_data, max_size)
     
-    def upload_cover_image(self, file_data, original_filename, override_filename=False):
+    def upload_cover_image(self, file_data, original_filename, override_filename=False, name_exists=None,
+                           timings=None):
         """
         上传封面图片到腾讯云COS
         :param file_data: 文件二进制数据
         :param original_filename: 原始文件名
+        :param override_filename: 是否使用生成的唯一文件名
+        :param name_exists: 检查图片名称是否已被占用的函数，已占用时不上传，避免覆盖已有封面引用的对象
+        :param timings: 传入字典时分别记录图片处理和存储调用的耗时(秒)，键为image和cos
         :return: (success, file_url, picture_name, major_color) 或 (success, error_message, None, None)
+        :raises ImageRejectedError: 图片无法识别或超出像素、帧数、大小限制
+        :raises DatabaseUnavailableError: 检查图片名称时数据库不可用
         """
         try:
-            # 调整图片大小
-            resized_data = self.resize_image(file_data)
-
-            # 提取主要颜色
-            major_color = self.extract_major_color(resized_data)
+            # 在图片处理进程池中调整大小、重新编码并提取主要颜色
+            start = time.perf_counter()
+            try:
+                resized_data, major_color, image_format = process_cover_image_in_pool(file_data)
+            finally:
+                if timings is not None:
+                    timings['image'] = time.perf_counter() - start
             
             # 生成唯一的文件名
-            file_ext = os.path.splitext(original_filename)[1].lower()
+            base_name, file_ext = os.path.splitext(original_filename)
+            file_ext = file_ext.lower()
             if not file_ext:
                 file_ext = '.jpg'  # 默认扩展名
             
+            # 重新编码后格式改变时同步修改扩展名
+            output_ext = FORMAT_EXTENSIONS.get(image_format)
+            if output_ext and self._get_content_type(output_ext) != self._get_content_type(file_ext):
+                file_ext = output_ext
+                original_filename = base_name + file_ext
+            
             # 使用时间戳和UUID生成唯一文件名
             picture_name = original_filename
             if override_filename:
@@ -146,21 +127,29 @@ class COSClient:
                 unique_id = str(uuid.uuid4())[:8]
                 picture_name = f"cover_{timestamp}_{unique_id}{file_ext}"
             
+            if name_exists is not None and name_exists(picture_name):
+                return False, f"图片已存在: {picture_name}", None, None
+
             # COS中的文件路径
             cos_key = f"covers/{picture_name}"
 
-            authres = self.get_file_meta(cos_key)
-            
-            # 上传到COS
-            response = self.client.put_object(
-                Bucket=self.bucket,
-                Body=resized_data,
-                Key=cos_key,
-                ContentType=self._get_content_type(file_ext),
-                Metadata = {
-                    'x-cos-meta-fileid': authres['respdata']['x_cos_meta_field_strs'][0]
-                }
-            )
+            start = time.perf_counter()
+            try:
+                authres = self.get_file_meta(cos_key)
+
+                # 上传到COS
+                response = self.client.put_object(
+                    Bucket=self.bucket,
+                    Body=resized_data,
+                    Key=cos_key,
+                    ContentType=self._get_content_type(file_ext),
+                    Metadata = {
+                        'x-cos-meta-fileid': authres['respdata']['x_cos_meta_field_strs'][0]
+                    }
+                )
+            finally:
+                if timings is not None:
+                    timings['cos'] = time.perf_counter() - start
             if 'ETag' in response:
                 # 生成文件访问URL
                 file_url = f"cloud://{config.ENV_ID}.{config.COS_BUCKET_NAME}/{cos_key}"
@@ -168,6 +157,8 @@ class COSClient:
             else:
                 return False, f"上传失败 {response}", None, None
                 
+        except (ExecutorSaturatedError, ExecutorTimeoutError, ImageRejectedError, DatabaseUnavailableError):
+            raise
         except Exception as e:
             return False, f"上传失败: {str(e)}", None, None
     
@@ -192,6 +183,105 @@ class COSClient:
         except Exception as e:
             return False, f"删除失败: {str(e)}"
     
+    def download_cover_image(self, picture_name):
+        """
+        从腾讯云COS下载封面图片
+        :param picture_name: 图片名称
+        :return: 文件二进制数据
+        """
+        return self.download_object(f"covers/{picture_name}")
+    
+    def download_object(self, cos_key, max_bytes=None):
+        """
+        下载COS中的对象
+        :param cos_key: 文件在COS中的路径
+        :param max_bytes: 最多读取的字节数，超出时多读取1字节即停止，由调用方判断是否超限
+        :return: 文件二进制数据
+        """
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=cos_key
+        )
+        stream = response['Body'].get_raw_stream()
+        if max_bytes is None:
+            return stream.read()
+        return stream.read(max_bytes + 1)
+
+    def get_object_size(self, cos_key):
+        """
+        只请求对象的元信息，获取对象大小
+        :param cos_key: 文件在COS中的路径
+        :return: 字节数
+        """
+        response = self.client.head_object(
+            Bucket=self.bucket,
+            Key=cos_key
+        )
+        return int(response['Content-Length'])
+    
+    def delete_object(self, cos_key):
+        """
+        删除COS中的对象
+        :param cos_key: 文件在COS中的路径
+        """
+        self.client.delete_object(
+            Bucket=self.bucket,
+            Key=cos_key
+        )
+    
+    def list_objects(self, prefix, marker='', max_keys=1000):
+        """
+        分页列出COS中的对象，按键的字节序返回
+        :param prefix: 键前缀
+        :param marker: 从该键之后开始列出
+        :param max_keys: 每页数量，最大1000
+        :return: (对象列表，每项包含Key、Size、LastModified, 下一页的marker，没有下一页时为None)
+        """
+        response = self.client.list_objects(
+            Bucket=self.bucket,
+            Prefix=prefix,
+            Marker=marker,
+            MaxKeys=max_keys
+        )
+        contents = response.get('Contents', [])
+        if response.get('IsTruncated') != 'true' or not contents:
+            return contents, None
+        return contents, response.get('NextMarker') or contents[-1]['Key']
+
+    def delete_objects(self, cos_keys):
+        """
+        批量删除COS中的对象，一次请求最多1000个
+        :param cos_keys: 文件在COS中的路径列表
+        :return: 删除失败的键列表
+        """
+        if not cos_keys:
+            return []
+        response = self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={
+                'Object': [{'Key': cos_key} for cos_key in cos_keys],
+                'Quiet': 'true'
+            }
+        )
+        errors = response.get('Error', [])
+        for error in errors:
+            logger.error(f"批量删除失败 {error.get('Key')}: {error.get('Message')}")
+        return [error.get('Key') for error in errors]
+
+    def get_presigned_upload_url(self, cos_key, expires):
+        """
+        生成客户端直传用的预签名PUT地址
+        :param cos_key: 文件在COS中的路径
+        :param expires: 有效期(秒)
+        :return: 预签名URL
+        """
+        return self.client.get_presigned_url(
+            Bucket=self.bucket,
+            Key=cos_key,
+            Method='PUT',
+            Expired=expires
+        )
+    
     def check_image_exists(self, picture_name):
         """
         检查图片是否存在于COS中
@@ -209,6 +299,32 @@ class COSClient:
             logger.error(f"检查文件存在性失败: {str(e)}")
             return False
     
+    def upload_cover_image_async(self, file_data, original_filename, override_filename=False, name_exists=None,
+                                 timings=None):
+        """
+        在COS执行器中上传封面图片
+        :return: Future，结果同upload_cover_image
+        :raises ExecutorSaturatedError: 执行器已满
+        """
+        return cos_executor.submit(self.upload_cover_image, file_data, original_filename, override_filename,
+                                   name_exists, timings)
+
+    def delete_cover_image_async(self, picture_name):
+        """
+        在COS执行器中删除封面图片
+        :return: Future，结果同delete_cover_image
+        :raises ExecutorSaturatedError: 执行器已满
+        """
+        return cos_executor.submit(self.delete_cover_image, picture_name)
+
+    def check_image_exists_async(self, picture_name):
+        """
+        在COS执行器中检查图片是否存在
+        :return: Future，结果同check_image_exists
+        :raises ExecutorSaturatedError: 执行器已满
+        """
+        return cos_executor.submit(self.check_image_exists, picture_name)
+
     def _get_content_type(self, file_ext):
         """
         根据文件扩展名获取Content-Type
@@ -1,245 +1,706 @@
 import logging
-
-from sqlalchemy.exc import OperationalError
-
-from wxcloudrun import db
-from wxcloudrun.model import Counters, CoverPicture, User
+import threading
+import time
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import and_, event, func, inspect, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+import config
+from wxcloudrun import db, replica_router
+from wxcloudrun.db_routing import use_bind
+from wxcloudrun.model import ChangeLog, Counters, CoverPicture, CoverUpload, User
+from wxcloudrun.resilience import CircuitBreaker, backoff_delay
+from wxcloudrun.single_flight import single_flight
 
 # 初始化日志
 logger = logging.getLogger('log')
 
+# 列表接口允许投影的字段
+COVER_PICTURE_FIELDS = ('id', 'picture_name', 'file_url', 'primary_cover', 'major_color', 'created_at', 'updated_at')
+USER_FIELDS = ('id', 'userid', 'user_name', 'comment', 'role', 'extra_message', 'created_at', 'updated_at')
+
+
+class DatabaseUnavailableError(Exception):
+    """数据库不可用，与"记录不存在"区分开"""
+
+
+# 数据库熔断器，进程内共享
+db_breaker = CircuitBreaker(config.DB_BREAKER_FAILURE_THRESHOLD, config.DB_BREAKER_RESET_TIMEOUT)
+
+_local = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    # 统计当前线程发出的SQL语句数，用于判断失败的调用是否真正访问过数据库
+    _local.statements = getattr(_local, 'statements', 0) + 1
+
+
+def _statement_count():
+    return getattr(_local, 'statements', 0)
+
+
+def _discard_session():
+    """
+    回滚并移除当前会话，已失效的连接不会再放回连接池
+    """
+    try:
+        db.session.rollback()
+    except Exception as e:
+        logger.error("rollback errorMsg= {} ".format(e))
+    db.session.remove()
+
+
+def _commit():
+    """
+    DAO写操作的提交点：在工作单元内只flush，由工作单元统一提交
+    """
+    if getattr(_local, 'in_unit_of_work', False):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+@contextmanager
+def unit_of_work(expire_on_commit=True):
+    """
+    工作单元：块内调用的DAO写操作合并为一个事务，块结束时只提交一次，出错时整体回滚
+    :param expire_on_commit: 提交后是否让已加载的实体过期，设为False可避免提交后读取属性时重新查询
+    :raises DatabaseUnavailableError: 数据库连接失败或熔断中
+    """
+    # 嵌套的工作单元并入外层事务
+    if getattr(_local, 'in_unit_of_work', False):
+        yield db.session
+        return
+
+    if not db_breaker.allow():
+        raise DatabaseUnavailableError('数据库熔断中')
+
+    session = db.session()
+    previous_expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = expire_on_commit
+    statements = _statement_count()
+    _local.depth = 1
+    _local.in_unit_of_work = True
+    try:
+        yield db.session
+        db.session.commit()
+        db_breaker.record_success()
+    except (OperationalError, DisconnectionError) as e:
+        logger.error("unit_of_work errorMsg= {} ".format(e))
+        _discard_session()
+        db_breaker.record_failure()
+        raise DatabaseUnavailableError(str(e)) from e
+    except Exception:
+        db.session.rollback()
+        # 执行过SQL时其他异常(如违反唯一约束)说明数据库可以正常响应，半开状态下的探测也算成功；
+        # 没有执行过SQL(如块内的业务校验失败)时不能说明数据库已恢复，只释放探测名额
+        if _statement_count() > statements:
+            db_breaker.record_success()
+        else:
+            db_breaker.release()
+        raise
+    except BaseException:
+        db.session.rollback()
+        db_breaker.release()
+        raise
+    finally:
+        _local.depth = 0
+        _local.in_unit_of_work = False
+        session.expire_on_commit = previous_expire_on_commit
+
 
+def _record_changes(topic, entity_ids, operation):
+    """
+    在当前事务中写入变更日志，与业务数据一起提交
+    :param topic: cover 或 user
+    :param entity_ids: 变更的记录ID
+    :param operation: INSERT、UPDATE 或 DELETE
+    """
+    now = datetime.now()
+    db.session.add_all([
+        ChangeLog(topic=topic, entity_id=entity_id, operation=operation, created_at=now)
+        for entity_id in entity_ids
+    ])
+
+
+def _primary_cover_ids():
+    """
+    :return: 当前主封面的ID列表，清除主封面前用于记录变更
+    """
+    return [row.id for row in CoverPicture.query.with_entities(CoverPicture.id).filter(
+        CoverPicture.primary_cover.is_(True))]
+
+
+def _attach(entity):
+    """
+    获取实体在当前会话中的实例，已在会话中的实体直接使用，避免重新查询
+    :return: 会话中的实体，数据库中不存在时返回None
+    """
+    if entity in db.session:
+        return entity
+    primary_key = inspect(entity).mapper.primary_key_from_instance(entity)
+    if db.session.query(type(entity)).get(primary_key) is None:
+        return None
+    return db.session.merge(entity)
+
+
+def _record_success(bind_key):
+    if bind_key is None:
+        db_breaker.record_success()
+    else:
+        replica_router.record_success(bind_key)
+
+
+def _release(bind_key):
+    if bind_key is None:
+        db_breaker.release()
+    else:
+        replica_router.release(bind_key)
+
+
+def db_operation(retry=False, read_only=False):
+    """
+    DAO统一执行包装：熔断、连接失效处理，以及幂等读操作的抖动退避重试
+    :param retry: 是否允许重试，只用于幂等的读操作
+    :param read_only: 是否可以在从库执行，从库失败时立即切换到主库，不计入重试次数
+    :raises DatabaseUnavailableError: 数据库连接失败或熔断中
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # 嵌套调用由最外层统一处理
+            if getattr(_local, 'depth', 0):
+                return f(*args, **kwargs)
+
+            bind_key = replica_router.choose() if read_only else None
+            if bind_key is None and not db_breaker.allow():
+                raise DatabaseUnavailableError('数据库熔断中')
+
+            attempts = max(1, config.DB_RETRY_ATTEMPTS) if retry else 1
+            attempt = 0
+            statements = _statement_count()
+            # 熔断器是否已记录本次调用的结果，未记录时需要释放半开状态下的探测名额
+            settled = False
+            _local.depth = 1
+            try:
+                while True:
+                    try:
+                        with use_bind(bind_key):
+                            result = f(*args, **kwargs)
+                    except (OperationalError, DisconnectionError) as e:
+                        _discard_session()
+                        if bind_key is not None:
+                            logger.error("{} replica={} errorMsg= {} ".format(f.__name__, bind_key, e))
+                            replica_router.record_failure(bind_key)
+                            bind_key = None
+                            if not db_breaker.allow():
+                                settled = True
+                                raise DatabaseUnavailableError('数据库熔断中') from e
+                            continue
+                        logger.error("{} attempt={} errorMsg= {} ".format(f.__name__, attempt + 1, e))
+                        attempt += 1
+                        if attempt >= attempts:
+                            db_breaker.record_failure()
+                            settled = True
+                            raise DatabaseUnavailableError(str(e)) from e
+                        time.sleep(backoff_delay(attempt - 1, config.DB_RETRY_BASE_DELAY, config.DB_RETRY_MAX_DELAY))
+                        continue
+                    except Exception:
+                        # 执行过SQL时其他异常(如违反唯一约束)说明数据库可以正常响应，
+                        # 否则交给finally释放探测名额
+                        if _statement_count() > statements:
+                            _record_success(bind_key)
+                            settled = True
+                        raise
+                    _record_success(bind_key)
+                    settled = True
+                    return result
+            finally:
+                _local.depth = 0
+                if not settled:
+                    _release(bind_key)
+        return decorated_function
+    return decorator
+
+
+@db_operation(retry=True)
 def query_counterbyid(id):
     """
     根据ID查询Counter实体
     :param id: Counter的ID
     :return: Counter实体
     """
-    try:
-        return Counters.query.filter(Counters.id == id).first()
-    except OperationalError as e:
-        logger.info("query_counterbyid errorMsg= {} ".format(e))
-        return None
+    return Counters.query.filter(Counters.id == id).first()
 
 
+@db_operation()
 def delete_counterbyid(id):
     """
     根据ID删除Counter实体
     :param id: Counter的ID
     """
-    try:
-        counter = Counters.query.get(id)
-        if counter is None:
-            return
-        db.session.delete(counter)
-        db.session.commit()
-    except OperationalError as e:
-        logger.info("delete_counterbyid errorMsg= {} ".format(e))
+    counter = Counters.query.get(id)
+    if counter is None:
+        return
+    db.session.delete(counter)
+    _commit()
 
 
+@db_operation()
 def insert_counter(counter):
     """
     插入一个Counter实体
     :param counter: Counters实体
     """
-    try:
-        db.session.add(counter)
-        db.session.commit()
-    except OperationalError as e:
-        logger.info("insert_counter errorMsg= {} ".format(e))
+    db.session.add(counter)
+    _commit()
 
 
+@db_operation()
 def update_counterbyid(counter):
     """
     根据ID更新counter的值
     :param counter实体
     """
-    try:
-        counter = query_counterbyid(counter.id)
-        if counter is None:
-            return
-        db.session.flush()
-        db.session.commit()
-    except OperationalError as e:
-        logger.info("update_counterbyid errorMsg= {} ".format(e))
+    if _attach(counter) is None:
+        return
+    _commit()
 
 
 # ==================== Cover Picture DAO ====================
 
+@db_operation()
 def insert_cover_picture(cover_picture):
     """
     插入封面图片记录
     :param cover_picture: CoverPicture实体
     """
-    try:
-        db.session.add(cover_picture)
-        db.session.commit()
-        return True
-    except OperationalError as e:
-        logger.info("insert_cover_picture errorMsg= {} ".format(e))
-        db.session.rollback()
-        return False
+    db.session.add(cover_picture)
+    db.session.flush()
+    _record_changes('cover', [cover_picture.id], 'INSERT')
+    _commit()
+    return True
 
 
+@db_operation(retry=True)
 def query_cover_picture_by_name(picture_name):
     """
     根据图片名称查询封面图片
     :param picture_name: 图片名称
     :return: CoverPicture实体
     """
-    try:
-        return CoverPicture.query.filter(CoverPicture.picture_name == picture_name).first()
-    except OperationalError as e:
-        logger.info("query_cover_picture_by_name errorMsg= {} ".format(e))
-        return None
+    return CoverPicture.query.filter(CoverPicture.picture_name == picture_name).first()
 
 
-def query_all_cover_pictures():
+@single_flight
+@db_operation(retry=True, read_only=True)
+def query_cover_pictures(fields=None, primary_only=False):
     """
-    查询所有封面图片
-    :return: CoverPicture实体列表
+    按条件查询封面图片，只查询需要的列，并发的相同查询合并为一次
+    :param fields: 需要返回的字段列表，None表示全部字段
+    :param primary_only: 是否只查询主封面
+    :return: 行列表，可按字段名访问
     """
-    try:
-        return CoverPicture.query.order_by(CoverPicture.created_at.desc()).all()
-    except OperationalError as e:
-        logger.info("query_all_cover_pictures errorMsg= {} ".format(e))
-        return []
+    columns = [getattr(CoverPicture, field) for field in (fields or COVER_PICTURE_FIELDS)]
+    query = CoverPicture.query.with_entities(*columns)
+    if primary_only:
+        query = query.filter(CoverPicture.primary_cover.is_(True))
+    return query.order_by(CoverPicture.created_at.desc()).all()
 
 
-def delete_cover_picture_by_name(picture_name):
+@db_operation(retry=True)
+def query_cover_picture_batch(after_id, limit):
     """
-    根据图片名称删除封面图片
-    :param picture_name: 图片名称
+    按ID顺序分批查询封面图片，用于批量任务遍历全表
+    :param after_id: 只查询ID大于该值的记录
+    :param limit: 每批数量
+    :return: 行列表，包含id、picture_name、major_color
     """
-    try:
-        cover_picture = CoverPicture.query.filter(CoverPicture.picture_name == picture_name).first()
-        if cover_picture is None:
-            return False
-        db.session.delete(cover_picture)
-        db.session.commit()
-        return True
-    except OperationalError as e:
-        logger.info("delete_cover_picture_by_name errorMsg= {} ".format(e))
-        db.session.rollback()
-        return False
+    return CoverPicture.query.with_entities(
+        CoverPicture.id, CoverPicture.picture_name, CoverPicture.major_color
+    ).filter(CoverPicture.id > after_id).order_by(CoverPicture.id).limit(limit).all()
 
 
-def update_primary_cover(picture_name, is_primary):
+@db_operation()
+def bulk_update_cover_pictures(mappings):
     """
-    更新封面图片的主封面状态
-    :param picture_name: 图片名称
-    :param is_primary: 是否为主封面
+    批量更新封面图片，一次提交
+    :param mappings: 字典列表，每项必须包含id
     """
-    try:
-        # 如果设置为主封面，先将其他所有图片设置为非主封面
-        if is_primary:
-            CoverPicture.query.update({CoverPicture.primary_cover: False})
-        
-        # 更新指定图片的主封面状态
-        cover_picture = CoverPicture.query.filter(CoverPicture.picture_name == picture_name).first()
-        if cover_picture:
-            cover_picture.primary_cover = is_primary
-            db.session.commit()
-            return True
-        return False
-    except OperationalError as e:
-        logger.info("update_primary_cover errorMsg= {} ".format(e))
-        db.session.rollback()
+    if not mappings:
+        return 0
+    db.session.bulk_update_mappings(CoverPicture, mappings)
+    _record_changes('cover', [mapping['id'] for mapping in mappings], 'UPDATE')
+    _commit()
+    return len(mappings)
+
+
+@db_operation()
+def delete_cover_pictures_by_names(picture_names):
+    """
+    按图片名称批量删除封面图片记录，一次提交
+    :param picture_names: 图片名称列表
+    :return: 删除的记录数
+    """
+    if not picture_names:
+        return 0
+    cover_ids = [row.id for row in CoverPicture.query.with_entities(CoverPicture.id).filter(
+        CoverPicture.picture_name.in_(picture_names))]
+    if not cover_ids:
+        return 0
+    _record_changes('cover', cover_ids, 'DELETE')
+    CoverPicture.query.filter(CoverPicture.id.in_(cover_ids)).delete(synchronize_session=False)
+    _commit()
+    return len(cover_ids)
+
+
+def stream_cover_picture_names(chunk_size=1000):
+    """
+    按字节序流式读取全部封面图片名称，与对象存储列出的键顺序一致。
+    使用独立连接和服务端游标，内存占用与表大小无关
+    :param chunk_size: 每次从游标读取的行数
+    :return: 生成器，产生(图片名称, 创建时间)
+    """
+    column = CoverPicture.picture_name
+    # MySQL默认排序规则不区分大小写，需要按字节排序
+    order = func.binary(column) if db.engine.dialect.name == 'mysql' else column
+    query = select(column, CoverPicture.created_at).order_by(order)
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        for partition in result.partitions(chunk_size):
+            for picture_name, created_at in partition:
+                yield picture_name, created_at
+
+
+@db_operation()
+def clear_primary_covers():
+    """
+    将所有图片设置为非主封面
+    """
+    cover_ids = _primary_cover_ids()
+    if not cover_ids:
+        return
+    CoverPicture.query.filter(CoverPicture.id.in_(cover_ids)).update(
+        {CoverPicture.primary_cover: False}, synchronize_session=False
+    )
+    _record_changes('cover', cover_ids, 'UPDATE')
+    _commit()
+
+
+@db_operation()
+def delete_cover_picture_entity(cover_picture):
+    """
+    删除已查询出的封面图片
+    :param cover_picture: CoverPicture实体
+    """
+    cover_picture = _attach(cover_picture)
+    if cover_picture is None:
         return False
+    _record_changes('cover', [cover_picture.id], 'DELETE')
+    db.session.delete(cover_picture)
+    _commit()
+    return True
+
+
+# ==================== Cover Upload DAO ====================
+
+@db_operation()
+def insert_cover_upload(cover_upload):
+    """
+    插入直传任务记录
+    :param cover_upload: CoverUpload实体
+    """
+    db.session.add(cover_upload)
+    _commit()
+    return True
+
+
+@db_operation(retry=True)
+def query_cover_upload(upload_id):
+    """
+    根据上传ID查询直传任务
+    :param upload_id: 上传ID
+    :return: CoverUpload实体
+    """
+    return CoverUpload.query.filter(CoverUpload.upload_id == upload_id).first()
+
+
+@db_operation()
+def claim_cover_upload(upload_id, lease_seconds):
+    """
+    将待处理或租约已过期的处理中任务原子地标记为处理中，保证同一时间只有一个处理者。
+    处理者异常退出后任务停留在处理中，租约过期后可以重新抢占；失败是终态，不再处理
+    :param upload_id: 上传ID
+    :param lease_seconds: 处理中任务的租约(秒)
+    :return: 抢占时间，作为本次处理的租约标识；未抢占到时返回None
+    """
+    # 数据库时间字段精度为秒，租约标识需要与存储的值完全一致
+    claimed_at = datetime.now().replace(microsecond=0)
+    claimed = CoverUpload.query.filter(
+        CoverUpload.upload_id == upload_id,
+        or_(
+            CoverUpload.status == 'PENDING',
+            and_(CoverUpload.status == 'PROCESSING',
+                 CoverUpload.updated_at < claimed_at - timedelta(seconds=lease_seconds))
+        )
+    ).update({
+        CoverUpload.status: 'PROCESSING',
+        CoverUpload.error_message: None,
+        CoverUpload.updated_at: claimed_at
+    }, synchronize_session=False)
+    _commit()
+    return claimed_at if claimed == 1 else None
+
+
+@db_operation()
+def update_cover_upload_status(upload_id, status, picture_name=None, error_message=None, claimed_at=None):
+    """
+    更新直传任务状态
+    :param upload_id: 上传ID
+    :param status: 新状态
+    :param picture_name: 处理完成后的图片名称
+    :param error_message: 失败原因
+    :param claimed_at: 处理者的租约标识，传入时只在租约仍属于该处理者时更新
+    :return: 是否更新成功
+    """
+    query = CoverUpload.query.filter(CoverUpload.upload_id == upload_id)
+    if claimed_at is not None:
+        query = query.filter(CoverUpload.status == 'PROCESSING', CoverUpload.updated_at == claimed_at)
+    updated = query.update({
+        CoverUpload.status: status,
+        CoverUpload.picture_name: picture_name,
+        CoverUpload.error_message: error_message[:500] if error_message else None
+    }, synchronize_session=False)
+    _commit()
+    return updated == 1
+
+
+def _stale_cover_uploads(cutoff):
+    """
+    :return: 过期任务的查询条件：创建早于cutoff仍待处理，或抢占早于cutoff仍在处理中
+    """
+    return or_(
+        and_(CoverUpload.status == 'PENDING', CoverUpload.created_at < cutoff),
+        and_(CoverUpload.status == 'PROCESSING', CoverUpload.updated_at < cutoff)
+    )
+
+
+@db_operation(retry=True)
+def count_stale_cover_uploads(cutoff):
+    """
+    统计已过期的直传任务数
+    :param cutoff: 过期时间点
+    :return: 任务数
+    """
+    return CoverUpload.query.filter(_stale_cover_uploads(cutoff)).count()
+
+
+@db_operation()
+def expire_cover_uploads(cutoff, limit):
+    """
+    将一批已过期的直传任务标记为失败
+    :param cutoff: 过期时间点
+    :param limit: 本批最多处理的任务数
+    :return: (本批选中的任务数, 已标记为失败的任务的原图路径列表)
+    """
+    rows = CoverUpload.query.with_entities(CoverUpload.id).filter(
+        _stale_cover_uploads(cutoff)).order_by(CoverUpload.id).limit(limit).all()
+    if not rows:
+        return 0, []
+    ids = [row.id for row in rows]
+    # 再次带上过期条件，选中后被重新抢占的任务不受影响
+    CoverUpload.query.filter(CoverUpload.id.in_(ids), _stale_cover_uploads(cutoff)).update({
+        CoverUpload.status: 'FAILED',
+        CoverUpload.error_message: '上传已过期'
+    }, synchronize_session=False)
+    _commit()
+    expired = CoverUpload.query.with_entities(CoverUpload.object_key).filter(
+        CoverUpload.id.in_(ids), CoverUpload.status == 'FAILED')
+    return len(ids), [row.object_key for row in expired]
 
 
 # ==================== User DAO ====================
 
+@db_operation()
 def insert_user(user):
     """
     插入用户记录
     :param user: User实体
     """
-    try:
-        db.session.add(user)
-        db.session.commit()
-        return True
-    except OperationalError as e:
-        logger.info("insert_user errorMsg= {} ".format(e))
-        db.session.rollback()
-        return False
+    db.session.add(user)
+    db.session.flush()
+    _record_changes('user', [user.id], 'INSERT')
+    _commit()
+    return True
 
 
+@db_operation(retry=True)
 def query_user_by_id(user_id):
     """
     根据ID查询用户
     :param user_id: 用户ID
     :return: User实体
     """
-    try:
-        return User.query.filter(User.id == user_id).first()
-    except OperationalError as e:
-        logger.info("query_user_by_id errorMsg= {} ".format(e))
-        return None
+    return User.query.filter(User.id == user_id).first()
 
 
+@db_operation(retry=True)
 def query_user_by_userid(userid):
     """
     根据微信ID查询用户
     :param userid: 微信ID
     :return: User实体
     """
-    try:
-        return User.query.filter(User.userid == userid).first()
-    except OperationalError as e:
-        logger.info("query_user_by_userid errorMsg= {} ".format(e))
-        return None
+    return User.query.filter(User.userid == userid).first()
 
 
-def query_all_users():
+@single_flight
+@db_operation(retry=True, read_only=True)
+def query_user_row_by_userid(userid, fields=None):
     """
-    查询所有用户
-    :return: User实体列表
+    根据微信ID查询用户的指定字段，并发的相同查询合并为一次
+    :param userid: 微信ID
+    :param fields: 需要返回的字段列表，None表示全部字段
+    :return: 行，可按字段名访问
     """
-    try:
-        return User.query.order_by(User.created_at.desc()).all()
-    except OperationalError as e:
-        logger.info("query_all_users errorMsg= {} ".format(e))
-        return []
+    columns = [getattr(User, field) for field in (fields or USER_FIELDS)]
+    return User.query.with_entities(*columns).filter(User.userid == userid).first()
 
 
+@db_operation(retry=True, read_only=True)
+def query_users(fields=None, role=None, user_name_prefix=None, created_after=None):
+    """
+    按条件查询用户，过滤和投影都在SQL中完成
+    :param fields: 需要返回的字段列表，None表示全部字段
+    :param role: 角色过滤
+    :param user_name_prefix: 用户名前缀过滤
+    :param created_after: 只返回该时间之后创建的用户
+    :return: 行列表，可按字段名访问
+    """
+    columns = [getattr(User, field) for field in (fields or USER_FIELDS)]
+    query = User.query.with_entities(*columns)
+    if role:
+        query = query.filter(User.role == role)
+    if user_name_prefix:
+        query = query.filter(User.user_name.startswith(user_name_prefix, autoescape=True))
+    if created_after:
+        query = query.filter(User.created_at > created_after)
+    return query.order_by(User.created_at.desc()).all()
+
+
+@db_operation(retry=True, read_only=True)
+def count_users_by_role():
+    """
+    按角色统计用户数量
+    :return: {角色: 数量} 字典
+    """
+    rows = db.session.query(User.role, func.count(User.id)).group_by(User.role).all()
+    return {role: count for role, count in rows}
+
+
+@db_operation()
 def update_user(user):
     """
-    更新用户信息
+    更新用户信息，已从会话中查询出的实体直接提交，不再重新查询
     :param user: User实体
     """
-    try:
-        existing_user = User.query.filter(User.id == user.id).first()
-        if existing_user is None:
-            return False
-        
-        existing_user.user_name = user.user_name
-        existing_user.comment = user.comment
-        existing_user.role = user.role
-        existing_user.extra_message = user.extra_message
-        existing_user.updated_at = user.updated_at
-        
-        db.session.commit()
-        return True
-    except OperationalError as e:
-        logger.info("update_user errorMsg= {} ".format(e))
-        db.session.rollback()
+    if _attach(user) is None:
         return False
+    _record_changes('user', [user.id], 'UPDATE')
+    _commit()
+    return True
 
 
-def delete_user_by_id(user_id):
+@db_operation()
+def delete_user_entity(user):
     """
-    根据ID删除用户
-    :param user_id: 用户ID
+    删除已查询出的用户
+    :param user: User实体
     """
-    try:
-        user = User.query.filter(User.id == user_id).first()
-        if user is None:
-            return False
-        db.session.delete(user)
-        db.session.commit()
-        return True
-    except OperationalError as e:
-        logger.info("delete_user_by_id errorMsg= {} ".format(e))
-        db.session.rollback()
+    user = _attach(user)
+    if user is None:
         return False
+    _record_changes('user', [user.id], 'DELETE')
+    db.session.delete(user)
+    _commit()
+    return True
+
+
+# ==================== Change Log DAO ====================
+
+@db_operation(retry=True)
+def query_change_versions():
+    """
+    查询各主题的最新版本号
+    :return: {主题: 版本号} 字典
+    """
+    rows = db.session.query(ChangeLog.topic, func.max(ChangeLog.id)).group_by(ChangeLog.topic).all()
+    return {topic: version for topic, version in rows}
+
+
+@db_operation(retry=True)
+def query_changes(since, limit):
+    """
+    按版本号顺序查询变更日志
+    :param since: 只查询版本号大于该值的变更
+    :param limit: 最多返回的条数
+    :return: 行列表，包含id、topic、entity_id、operation、created_at
+    """
+    return ChangeLog.query.with_entities(
+        ChangeLog.id, ChangeLog.topic, ChangeLog.entity_id, ChangeLog.operation, ChangeLog.created_at
+    ).filter(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit).all()
+
+
+@db_operation(retry=True)
+def query_change_id_bounds():
+    """
+    :return: (最小版本号, 最大版本号)，没有变更时为(None, None)
+    """
+    return tuple(db.session.query(func.min(ChangeLog.id), func.max(ChangeLog.id)).one())
+
+
+@db_operation()
+def delete_change_logs(ids):
+    """
+    按版本号删除变更日志
+    :param ids: 版本号列表
+    :return: 删除的条数
+    """
+    if not ids:
+        return 0
+    deleted = ChangeLog.query.filter(ChangeLog.id.in_(ids)).delete(synchronize_session=False)
+    _commit()
+    return deleted
+
+
+@db_operation(retry=True)
+def query_cover_pictures_by_ids(ids, fields=None):
+    """
+    按ID批量查询封面图片
+    :param ids: ID列表
+    :param fields: 需要返回的字段列表，None表示全部字段
+    :return: 行列表，可按字段名访问
+    """
+    if not ids:
+        return []
+    columns = [getattr(CoverPicture, field) for field in (fields or COVER_PICTURE_FIELDS)]
+    return CoverPicture.query.with_entities(*columns).filter(CoverPicture.id.in_(ids)).all()
+
+
+@db_operation(retry=True)
+def query_users_by_ids(ids, fields=None):
+    """
+    按ID批量查询用户
+    :param ids: ID列表
+    :param fields: 需要返回的字段列表，None表示全部字段
+    :return: 行列表，可按字段名访问
+    """
+    if not ids:
+        return []
+    columns = [getattr(User, field) for field in (fields or USER_FIELDS)]
+    return User.query.with_entities(*columns).filter(User.id.in_(ids)).all()
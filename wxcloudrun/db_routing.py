@@ -0,0 +1,169 @@
+import hashlib
+import hmac
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+from wxcloudrun.resilience import CircuitBreaker
+
+# 当前线程的查询路由，None表示主库
+_route = threading.local()
+
+# 携带写入时间的请求头和Cookie，请求可能落到任意实例，读己之写窗口需要由客户端带回
+WRITE_TOKEN_HEADER = 'X-Last-Write'
+WRITE_TOKEN_COOKIE = 'last_write'
+
+
+@contextmanager
+def use_bind(bind_key):
+    """
+    块内的查询发往指定的数据库绑定
+    :param bind_key: SQLALCHEMY_BINDS中的键，None表示主库
+    """
+    previous = getattr(_route, 'bind_key', None)
+    _route.bind_key = bind_key
+    try:
+        yield
+    finally:
+        _route.bind_key = previous
+
+
+class RoutingSession(SignallingSession):
+    """
+    按线程路由选择连接的会话：只读DAO操作在use_bind块内执行时使用从库，其余情况与默认会话一致
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        bind_key = getattr(_route, 'bind_key', None)
+        if bind_key is not None:
+            return get_state(self.app).db.get_engine(self.app, bind=bind_key)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    """
+    从库选择：在健康的从库间轮询，每个从库一个熔断器，失败后冷却期内不再使用，
+    冷却结束后放行一次探测查询；管理员写操作后的一段时间内读操作走主库，保证读到自己的写入。
+    写入时间记录在本进程中，同时以签名令牌返回给客户端，客户端带回令牌时任意实例都会读主库
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, read_your_writes_window, secret):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.read_your_writes_window = read_your_writes_window
+        self._secret = secret.encode('utf-8')
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._bind_keys = []
+        self._next = 0
+        self._last_write = None
+        self._reads = {}
+
+    def configure(self, bind_keys):
+        """
+        :param bind_keys: 从库在SQLALCHEMY_BINDS中的键
+        """
+        with self._lock:
+            self._bind_keys = list(bind_keys)
+            self._breakers = {key: CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                              for key in self._bind_keys}
+            self._reads = {key: 0 for key in self._bind_keys + ['primary']}
+            self._next = 0
+
+    @property
+    def bind_keys(self):
+        return list(self._bind_keys)
+
+    def mark_write(self):
+        """
+        记录一次管理员写操作，开始读己之写窗口
+        """
+        with self._lock:
+            self._last_write = time.monotonic()
+
+    def _sign(self, value):
+        return hmac.new(self._secret, value.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def write_token(self):
+        """
+        :return: 当前时间的签名令牌，格式为 时间戳.签名
+        """
+        written_at = f'{time.time():.3f}'
+        return f'{written_at}.{self._sign(written_at)}'
+
+    def attach_write_token(self, response):
+        """
+        在写操作的响应中返回写入令牌，作为after_this_request回调在视图返回后调用
+        """
+        token = self.write_token()
+        response.headers[WRITE_TOKEN_HEADER] = token
+        response.set_cookie(WRITE_TOKEN_COOKIE, token, max_age=math.ceil(self.read_your_writes_window),
+                            httponly=True, samesite='Lax')
+        return response
+
+    def _client_in_window(self):
+        """
+        :return: 当前请求带回的写入令牌是否仍在窗口内；签名不符的令牌被忽略，不能用来把读请求压到主库
+        """
+        if not has_request_context():
+            return False
+        token = request.headers.get(WRITE_TOKEN_HEADER) or request.cookies.get(WRITE_TOKEN_COOKIE)
+        if not token:
+            return False
+        written_at, _, signature = token.rpartition('.')
+        if not hmac.compare_digest(signature, self._sign(written_at)):
+            return False
+        try:
+            age = time.time() - float(written_at)
+        except ValueError:
+            return False
+        # 各实例的时钟可能有少量偏差，令牌时间略晚于本机时间也视为在窗口内
+        return abs(age) < self.read_your_writes_window
+
+    def choose(self):
+        """
+        :return: 本次读操作使用的从库键，None表示使用主库
+        """
+        client_in_window = self._bind_keys and self._client_in_window()
+        with self._lock:
+            keys = self._bind_keys
+            in_window = client_in_window or self._last_write is not None and \
+                time.monotonic() - self._last_write < self.read_your_writes_window
+            if keys and not in_window:
+                for offset in range(len(keys)):
+                    key = keys[(self._next + offset) % len(keys)]
+                    if self._breakers[key].allow():
+                        self._next = (self._next + offset + 1) % len(keys)
+                        self._reads[key] += 1
+                        return key
+            self._reads['primary'] = self._reads.get('primary', 0) + 1
+            return None
+
+    def record_success(self, bind_key):
+        self._breakers[bind_key].record_success()
+
+    def record_failure(self, bind_key):
+        self._breakers[bind_key].record_failure()
+
+    def release(self, bind_key):
+        self._breakers[bind_key].release()
+
+    def stats(self):
+        with self._lock:
+            in_window = self._last_write is not None and \
+                time.monotonic() - self._last_write < self.read_your_writes_window
+            return {
+                'replicas': {key: self._breakers[key].stats() for key in self._bind_keys},
+                'reads': dict(self._reads),
+                'read_your_writes': in_window
+            }
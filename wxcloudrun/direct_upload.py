@@ -0,0 +1,181 @@
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import config
+from wxcloudrun import app, replica_router
+from wxcloudrun.cos_client import cos_client, cos_executor
+from wxcloudrun.dao import (
+    claim_cover_upload, clear_primary_covers, count_stale_cover_uploads, expire_cover_uploads,
+    insert_cover_picture, insert_cover_upload, query_cover_upload, unit_of_work, update_cover_upload_status
+)
+from wxcloudrun.image_guard import ImageRejectedError
+from wxcloudrun.model import CoverPicture, CoverUpload
+
+logger = logging.getLogger('log')
+
+# 客户端直传的原图存放目录，处理完成后删除
+UPLOAD_PREFIX = 'uploads/'
+
+
+class LeaseLostError(Exception):
+    """处理时间超过租约，任务已被其他处理者重新抢占"""
+
+
+def create_upload(original_filename, primary_cover):
+    """
+    创建直传任务并生成预签名上传地址
+    :param original_filename: 原始文件名
+    :param primary_cover: 处理完成后是否设为主封面
+    :return: 直传任务信息字典
+    """
+    upload_id = uuid.uuid4().hex
+    file_ext = os.path.splitext(original_filename)[1].lower()
+    object_key = f"{UPLOAD_PREFIX}{upload_id}{file_ext}"
+
+    cover_upload = CoverUpload()
+    cover_upload.upload_id = upload_id
+    cover_upload.object_key = object_key
+    cover_upload.original_filename = original_filename
+    cover_upload.primary_cover = primary_cover
+    cover_upload.status = 'PENDING'
+    cover_upload.created_at = datetime.now()
+    cover_upload.updated_at = datetime.now()
+    insert_cover_upload(cover_upload)
+
+    return {
+        'upload_id': upload_id,
+        'upload_url': cos_client.get_presigned_upload_url(object_key, config.DIRECT_UPLOAD_EXPIRES),
+        'method': 'PUT',
+        'content_type': cos_client._get_content_type(file_ext),
+        'expires_in': config.DIRECT_UPLOAD_EXPIRES
+    }
+
+
+def finalize_upload(upload_id):
+    """
+    客户端上传完成后调用，也可作为存储回调的入口。
+    重复调用是幂等的：只有待处理或处理租约已过期的任务会被提交处理
+    :param upload_id: 上传ID
+    :return: 直传任务，不存在时返回None
+    :raises ExecutorSaturatedError: COS执行器已满，任务保持待处理状态
+    """
+    cover_upload = query_cover_upload(upload_id)
+    if cover_upload is None:
+        return None
+
+    claimed_at = claim_cover_upload(upload_id, config.DIRECT_UPLOAD_LEASE_SECONDS)
+    if claimed_at is not None:
+        try:
+            cos_executor.submit(process_upload, upload_id, claimed_at)
+        except Exception:
+            # 未能提交时退回待处理状态，客户端可以重试
+            update_cover_upload_status(upload_id, 'PENDING', claimed_at=claimed_at)
+            raise
+
+    return query_cover_upload(upload_id)
+
+
+def process_upload(upload_id, claimed_at):
+    """
+    后台处理直传的原图：下载、调整大小和编码、提取主要颜色、写入封面目录和数据库
+    :param upload_id: 上传ID
+    :param claimed_at: 抢占任务时的租约标识，只有租约仍有效时才写入结果
+    """
+    with app.app_context():
+        cover_upload = query_cover_upload(upload_id)
+        # 排队期间租约过期、任务已被重新抢占时不再处理
+        if cover_upload is None or cover_upload.status != 'PROCESSING' or cover_upload.updated_at != claimed_at:
+            return
+
+        picture_name = None
+        try:
+            # 预签名上传不限制大小，先读取元信息检查大小，避免把超大对象读入内存
+            size = cos_client.get_object_size(cover_upload.object_key)
+            if size > config.DIRECT_UPLOAD_MAX_BYTES:
+                raise ImageRejectedError('bytes', f'文件超过{config.DIRECT_UPLOAD_MAX_BYTES}字节')
+            # 对象可能在检查后被替换，下载时同样限制读取的字节数
+            raw_data = cos_client.download_object(cover_upload.object_key, config.DIRECT_UPLOAD_MAX_BYTES)
+            if len(raw_data) > config.DIRECT_UPLOAD_MAX_BYTES:
+                raise ImageRejectedError('bytes', f'文件超过{config.DIRECT_UPLOAD_MAX_BYTES}字节')
+
+            # 使用生成的唯一文件名，失败重试时不会与已有封面冲突
+            success, result, picture_name, major_color = cos_client.upload_cover_image(
+                raw_data, cover_upload.original_filename, override_filename=True
+            )
+            if not success:
+                raise RuntimeError(result)
+
+            cover_picture = CoverPicture()
+            cover_picture.picture_name = picture_name
+            cover_picture.file_url = result
+            cover_picture.primary_cover = cover_upload.primary_cover
+            cover_picture.major_color = major_color
+            cover_picture.created_at = datetime.now()
+            cover_picture.updated_at = datetime.now()
+
+            # 封面记录和任务状态在同一个事务中提交
+            with unit_of_work():
+                if cover_upload.primary_cover:
+                    clear_primary_covers()
+                insert_cover_picture(cover_picture)
+                if not update_cover_upload_status(upload_id, 'DONE', picture_name=picture_name,
+                                                  claimed_at=claimed_at):
+                    raise LeaseLostError('处理超过租约，任务已被重新提交')
+            replica_router.mark_write()
+        except Exception as e:
+            logger.error(f"直传任务处理失败 {upload_id}: {str(e)}")
+            if picture_name:
+                cos_client.delete_cover_image(picture_name)
+            # 图片不符合要求时重试也不会成功，标记为失败并删除原图；其他错误(如对象尚未上传、存储暂时不可用)
+            # 退回待处理，客户端可以再次提交，超过有效期仍未完成的由expire_stale_uploads清理。
+            # 数据库不可用时任务停留在处理中，租约过期后可以重新提交
+            if not isinstance(e, ImageRejectedError):
+                update_cover_upload_status(upload_id, 'PENDING', error_message=str(e), claimed_at=claimed_at)
+                return
+            if not update_cover_upload_status(upload_id, 'FAILED', error_message=str(e), claimed_at=claimed_at):
+                return
+
+        try:
+            cos_client.delete_object(cover_upload.object_key)
+        except Exception as e:
+            logger.error(f"删除直传原图失败 {cover_upload.object_key}: {str(e)}")
+
+
+def expire_stale_uploads(repair=True, batch_size=500):
+    """
+    清理超过有效期仍未完成的直传任务：预签名地址过期后又经过一个处理租约仍待处理，
+    或抢占后同样时长仍在处理中的任务标记为失败，并删除其原图
+    :param repair: 为False时只统计，不修改数据
+    :param batch_size: 每批处理的任务数
+    :return: 统计字典，包含stale、expired、deleted
+    """
+    cutoff = datetime.now() - timedelta(seconds=config.DIRECT_UPLOAD_EXPIRES + config.DIRECT_UPLOAD_LEASE_SECONDS)
+    stats = {'stale': 0, 'expired': 0, 'deleted': 0}
+    if not repair:
+        stats['stale'] = count_stale_cover_uploads(cutoff)
+        return stats
+
+    while True:
+        selected, object_keys = expire_cover_uploads(cutoff, batch_size)
+        stats['stale'] += selected
+        stats['expired'] += len(object_keys)
+        if object_keys:
+            failed = cos_client.delete_objects(object_keys)
+            stats['deleted'] += len(object_keys) - len(failed)
+        if selected < batch_size:
+            return stats
+
+
+def upload_to_dict(cover_upload):
+    """
+    :return: 直传任务的响应字典
+    """
+    return {
+        'upload_id': cover_upload.upload_id,
+        'status': cover_upload.status,
+        'picture_name': cover_upload.picture_name,
+        'primary_cover': cover_upload.primary_cover,
+        'error_message': cover_upload.error_message
+    }
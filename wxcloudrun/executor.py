@@ -0,0 +1,99 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger('log')
+
+
+class ExecutorSaturatedError(Exception):
+    """执行器的工作线程和等待队列均已占满"""
+
+
+class ExecutorTimeoutError(Exception):
+    """任务未在规定时间内完成"""
+
+
+class BoundedExecutor:
+    """
+    有界线程池：同时执行的任务数为max_workers，最多再排队queue_size个任务，
+    超出时立即抛出ExecutorSaturatedError，而不是让请求线程阻塞等待
+    """
+
+    def __init__(self, max_workers, queue_size, thread_name_prefix=''):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self._executor = self._create_executor(max_workers, thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def _create_executor(self, max_workers, thread_name_prefix):
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        提交任务
+        :return: Future
+        :raises ExecutorSaturatedError: 执行器已满
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturatedError('执行器已满')
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        提交任务并等待结果
+        :param timeout: 等待秒数，None表示一直等待
+        :return: 任务返回值
+        :raises ExecutorSaturatedError: 执行器已满
+        :raises ExecutorTimeoutError: 任务超时
+        """
+        return wait_result(self.submit(fn, *args, **kwargs), timeout)
+
+    def stats(self):
+        """
+        :return: 当前排队/执行中的任务数和累计拒绝数
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queue_size': self.queue_size,
+                'pending': self._pending,
+                'rejected': self._rejected
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+
+def wait_result(future, timeout):
+    """
+    等待Future结果，超时后尝试取消尚未开始的任务
+    :param future: Future
+    :param timeout: 等待秒数，None表示一直等待
+    :return: 任务返回值
+    :raises ExecutorTimeoutError: 任务超时
+    """
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        logger.error(f"任务执行超时: {timeout}s")
+        raise ExecutorTimeoutError(f'任务执行超过{timeout}秒')
@@ -0,0 +1,175 @@
+import io
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image, UnidentifiedImageError
+
+import config
+
+logger = logging.getLogger('log')
+
+# 允许上传的图片格式
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP')
+
+# 解码后每个像素占用的字节数，Pillow中三通道图片也按4字节存储
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'LA': 4, 'PA': 4, 'La': 4}
+
+# PIL的解压炸弹阈值，进程内所有Image.open都受此限制。像素数在阈值的1到2倍之间时PIL只给出
+# DecompressionBombWarning，超过2倍才抛出DecompressionBombError，因此上限由inspect_image
+# 按IMAGE_MAX_PIXELS显式检查，这里只是兜底
+Image.MAX_IMAGE_PIXELS = config.IMAGE_MAX_PIXELS
+
+
+class ImageRejectedError(Exception):
+    """
+    图片未通过入库检查
+    :param reason: 拒绝原因，invalid、format、bytes、pixels、frames、memory
+    """
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def inspect_image(image_data, max_size=1440):
+    """
+    只读取文件头检查图片，不解码像素数据
+    :param image_data: 图片二进制数据
+    :param max_size: 处理后的最大尺寸，用于估算JPEG缩小解码后的内存
+    :return: 图片信息字典，包含format、mode、width、height、frames、estimated_bytes
+    :raises ImageRejectedError: 图片无法识别或超出限制
+    """
+    if len(image_data) > config.IMAGE_MAX_INPUT_BYTES:
+        raise ImageRejectedError('bytes', f'文件大小{len(image_data)}字节，超过上限{config.IMAGE_MAX_INPUT_BYTES}')
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError('pixels', str(e)) from e
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as e:
+        raise ImageRejectedError('invalid', f'无法识别的图片: {str(e)}') from e
+
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageRejectedError('format', f'不支持的图片格式: {image.format}')
+
+    width, height = image.size
+    pixels = width * height
+    if pixels > config.IMAGE_MAX_PIXELS:
+        raise ImageRejectedError('pixels', f'图片{width}x{height}，像素数超过上限{config.IMAGE_MAX_PIXELS}')
+
+    # 动图只统计帧数，不解码各帧
+    frames = getattr(image, 'n_frames', 1)
+    if frames > config.IMAGE_MAX_FRAMES:
+        raise ImageRejectedError('frames', f'动图{frames}帧，超过上限{config.IMAGE_MAX_FRAMES}')
+    if frames > 1 and pixels * frames > config.IMAGE_MAX_ANIMATION_PIXELS:
+        raise ImageRejectedError('frames', f'动图总像素数{pixels * frames}，超过上限{config.IMAGE_MAX_ANIMATION_PIXELS}')
+
+    # 处理时最多同时存在解码后的原图和一份转换后的副本，动图只解码第一帧；
+    # 需要缩小的JPEG按1/2、1/4、1/8解码
+    scale = 1
+    if image.format == 'JPEG':
+        while scale < 8 and max(width, height) >= max_size * scale * 2:
+            scale *= 2
+    decoded_pixels = -(-width // scale) * -(-height // scale)
+    estimated_bytes = decoded_pixels * (MODE_BYTES.get(image.mode, 4) + 4)
+    if estimated_bytes > config.IMAGE_DECODE_MEMORY_BUDGET:
+        raise ImageRejectedError('memory', f'预计解码内存{estimated_bytes}字节，超过上限{config.IMAGE_DECODE_MEMORY_BUDGET}')
+
+    return {
+        'format': image.format,
+        'mode': image.mode,
+        'width': width,
+        'height': height,
+        'frames': frames,
+        'estimated_bytes': estimated_bytes
+    }
+
+
+def _read_status(field):
+    """
+    :return: /proc/self/status中的内存字段(字节)，不可用时返回None
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """
+    重置进程的峰值常驻内存(VmHWM)，需要Linux 4.0及以上
+    :return: 是否成功
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def track_peak_memory():
+    """
+    统计块内进程常驻内存的峰值。在图片处理进程中每次只处理一张图片，结果即为单次处理的峰值；
+    在请求进程中处理时会包含其他线程的内存，只能作为参考
+    :return: 统计字典，块结束后包含rss_before_bytes、peak_rss_bytes、peak_delta_bytes
+    """
+    stats = {}
+    rss_before = _read_status('VmRSS')
+    reset = _reset_peak_rss()
+    try:
+        yield stats
+    finally:
+        peak = _read_status('VmHWM') if reset else None
+        stats['rss_before_bytes'] = rss_before
+        stats['peak_rss_bytes'] = peak
+        stats['peak_delta_bytes'] = peak - rss_before if peak is not None and rss_before is not None else None
+
+
+class IngestStats:
+    """
+    进程内的图片入库统计：处理数量、按原因统计的拒绝数量和最近若干次处理的峰值内存
+    """
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._rejected = {}
+        self._recent = deque(maxlen=window)
+        self._last = None
+
+    def record(self, info, memory, duration_ms):
+        with self._lock:
+            self._processed += 1
+            self._last = dict(info, duration_ms=duration_ms, **memory)
+            if memory.get('peak_delta_bytes') is not None:
+                self._recent.append(memory['peak_delta_bytes'])
+
+    def record_rejected(self, reason):
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                'processed': self._processed,
+                'rejected': dict(self._rejected),
+                'peak_delta_bytes': {
+                    'samples': len(recent),
+                    'p50': recent[len(recent) // 2] if recent else None,
+                    'p95': recent[min(len(recent) - 1, len(recent) * 95 // 100)] if recent else None,
+                    'max': recent[-1] if recent else None
+                },
+                'last': self._last
+            }
+
+
+ingest_stats = IngestStats()
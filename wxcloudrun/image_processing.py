@@ -0,0 +1,326 @@
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from PIL import Image, ImageOps
+from colorthief import ColorThief
+
+import config
+from wxcloudrun.executor import BoundedExecutor, wait_result
+from wxcloudrun.image_guard import ImageRejectedError, ingest_stats, inspect_image, track_peak_memory
+
+logger = logging.getLogger('log')
+
+
+def extract_major_color(image_data):
+    """
+    提取图片的主要颜色
+    :param image_data: 图片二进制数据
+    :return: 十六进制颜色字符串，如 #FF5733
+    """
+    try:
+        # 将图片数据保存到临时BytesIO对象
+        image_io = io.BytesIO(image_data)
+
+        # 使用ColorThief提取主要颜色，在缩略图上取色，动图只解码第一帧，内存占用与原图尺寸无关
+        color_thief = ColorThief(image_io)
+        color_thief.image.thumbnail((config.IMAGE_COLOR_SAMPLE_SIZE, config.IMAGE_COLOR_SAMPLE_SIZE))
+        dominant_color = color_thief.get_color(quality=1)
+
+        logger.debug(f"提取的主要颜色RGB值: {dominant_color}")
+
+        # 将RGB转换为十六进制
+        hex_color = "#{:02x}{:02x}{:02x}".format(
+            dominant_color[0],
+            dominant_color[1],
+            dominant_color[2]
+        )
+
+        return hex_color
+
+    except (MemoryError, Image.DecompressionBombError):
+        raise
+    except Exception as e:
+        logger.error(f"提取主要颜色失败: {str(e)}")
+        return "#FFFFFF"  # 默认返回白色
+
+
+# 输出格式对应的文件扩展名
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'BMP': '.bmp'
+}
+
+
+def _output_format(image, source_format):
+    """
+    根据配置确定输出格式，JPEG不支持透明通道，带透明通道的图片保持原格式
+    """
+    output_format = config.IMAGE_OUTPUT_FORMAT or source_format
+    if output_format not in FORMAT_EXTENSIONS:
+        return source_format
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if output_format == 'JPEG' and has_alpha:
+        return source_format
+    return output_format
+
+
+def _encode(image, format, quality, icc_profile):
+    """
+    按指定格式和质量编码，不写入EXIF等元数据，只保留ICC颜色配置
+    """
+    output = io.BytesIO()
+    if format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, format='JPEG', quality=quality, optimize=True,
+                   progressive=config.IMAGE_PROGRESSIVE_JPEG, icc_profile=icc_profile)
+    elif format == 'WEBP':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+        image.save(output, format='WEBP', quality=quality, method=4, icc_profile=icc_profile)
+    else:
+        image.save(output, format=format, optimize=True)
+    return output.getvalue()
+
+
+def encode_with_budget(image, format, byte_budget, icc_profile=None):
+    """
+    在质量区间内二分查找不超过字节预算的最高质量，预算为0时使用最高质量
+    :param image: PIL图片
+    :param format: 输出格式，只有JPEG和WEBP支持质量搜索
+    :param byte_budget: 字节预算
+    :return: (图片二进制数据, 使用的质量)
+    """
+    low, high = config.IMAGE_QUALITY_MIN, config.IMAGE_QUALITY_MAX
+    if format not in ('JPEG', 'WEBP'):
+        return _encode(image, format, None, icc_profile), None
+    if byte_budget <= 0:
+        return _encode(image, format, high, icc_profile), high
+
+    best, last = None, None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, format, quality, icc_profile)
+        last = (data, quality)
+        if len(data) <= byte_budget:
+            best = last
+            low = quality + 1
+        else:
+            high = quality - 1
+    # 最低质量仍超出预算时使用最低质量的结果
+    return best or last
+
+
+def encode_cover_image(image_data, max_size=1440):
+    """
+    调整图片大小，保持宽高比，确保最大边不超过max_size，并按字节预算重新编码
+    :param image_data: 图片二进制数据
+    :param max_size: 最大尺寸，默认1440px
+    :return: (图片二进制数据, 图片格式)
+    """
+    source_format = 'JPEG'
+    try:
+        # 打开图片
+        image = Image.open(io.BytesIO(image_data))
+        source_format = image.format if image.format else 'JPEG'
+
+        # 动图保持原样
+        if getattr(image, 'is_animated', False):
+            return image_data, source_format
+
+        output_format = _output_format(image, source_format)
+        byte_budget = config.IMAGE_BYTE_BUDGET
+
+        # 获取原始尺寸
+        width, height = image.size
+        needs_resize = width > max_size or height > max_size
+
+        # 尺寸、格式和大小都符合要求时直接返回原图
+        if not needs_resize and output_format == source_format and \
+                (byte_budget <= 0 or len(image_data) <= byte_budget):
+            return image_data, source_format
+
+        icc_profile = image.info.get('icc_profile')
+        if needs_resize and image.format == 'JPEG':
+            # JPEG按缩小后的尺寸解码(1/2、1/4、1/8)，减少解码内存
+            scale = max_size / max(width, height)
+            image.draft('RGB', (int(width * scale), int(height * scale)))
+
+        # 按EXIF方向旋转后再丢弃EXIF
+        image = ImageOps.exif_transpose(image)
+
+        if needs_resize:
+            # 计算新尺寸，保持宽高比
+            width, height = image.size
+            if width > height:
+                new_width = max_size
+                new_height = int(height * max_size / width)
+            else:
+                new_height = max_size
+                new_width = int(width * max_size / height)
+
+            # 调整图片大小
+            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+        output_data, quality = encode_with_budget(image, output_format, byte_budget, icc_profile)
+
+        # 未缩放且格式不变时，重新编码反而变大则保留原图
+        if not needs_resize and output_format == source_format and len(output_data) >= len(image_data):
+            return image_data, source_format
+
+        logger.info(f"图片编码: {source_format} {len(image_data)} bytes -> {output_format} "
+                    f"q={quality} {len(output_data)} bytes")
+        return output_data, output_format
+
+    except (MemoryError, Image.DecompressionBombError):
+        raise
+    except Exception as e:
+        logger.error(f"图片调整大小失败: {str(e)}")
+        return image_data, source_format  # 如果调整失败，返回原始数据
+
+
+def resize_image(image_data, max_size=1440):
+    """
+    调整图片大小并按字节预算重新编码
+    :param image_data: 图片二进制数据
+    :param max_size: 最大尺寸，默认1440px
+    :return: 调整后的图片二进制数据
+    :raises ImageRejectedError: 图片无法识别或超出限制
+    """
+    inspect_image(image_data, max_size)
+    return encode_cover_image(image_data, max_size)[0]
+
+
+def _process_inspected(image_data, max_size):
+    output_data, image_format = encode_cover_image(image_data, max_size)
+    return output_data, extract_major_color(output_data), image_format
+
+
+def process_cover_image(image_data, max_size=1440):
+    """
+    封面图片处理：检查文件头后调整大小、重新编码并提取主要颜色
+    :param image_data: 图片二进制数据
+    :param max_size: 最大尺寸
+    :return: (处理后的图片二进制数据, 主要颜色, 图片格式)
+    :raises ImageRejectedError: 图片无法识别或超出像素、帧数、大小限制
+    """
+    inspect_image(image_data, max_size)
+    return _process_inspected(image_data, max_size)
+
+
+def compute_cover_metadata(image_data, max_size=1440):
+    """
+    重新计算封面图片的衍生数据，与上传时使用相同的处理流程
+    :param image_data: 图片二进制数据
+    :param max_size: 最大尺寸
+    :return: 衍生字段字典
+    """
+    _, major_color, _ = process_cover_image(image_data, max_size)
+    return {'major_color': major_color}
+
+
+def _process_shared(shm_name, size, max_size):
+    """
+    工作进程入口：从共享内存读取原图，避免通过管道序列化传输。
+    文件头已在请求进程中检查过
+    :return: (处理结果, 峰值内存统计)
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image_data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    with track_peak_memory() as memory:
+        result = _process_inspected(image_data, max_size)
+    return result, memory
+
+
+class BoundedProcessExecutor(BoundedExecutor):
+    """
+    有界进程池，图片处理不受GIL限制，也不会占用请求所在进程的CPU时间片
+    """
+
+    def _create_executor(self, max_workers, thread_name_prefix):
+        # 不使用fork，避免复制多线程进程中的锁状态
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def get_image_pool():
+    """
+    :return: 图片处理进程池，首次使用时创建；未配置工作进程时返回None
+    """
+    global _pool
+    if config.IMAGE_PROCESS_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = BoundedProcessExecutor(config.IMAGE_PROCESS_WORKERS, config.IMAGE_PROCESS_QUEUE_SIZE)
+        return _pool
+
+
+def _reset_image_pool(broken_pool):
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    broken_pool.shutdown(wait=False)
+
+
+def _process_in_current_process(image_data, max_size):
+    with track_peak_memory() as memory:
+        result = _process_inspected(image_data, max_size)
+    return result, memory
+
+
+def process_cover_image_in_pool(image_data, max_size=1440):
+    """
+    在进程池中处理封面图片。先在当前进程检查文件头，通过后原图经共享内存交给工作进程，
+    并记录本次处理的峰值内存
+    :return: (处理后的图片二进制数据, 主要颜色, 图片格式)
+    :raises ImageRejectedError: 图片无法识别或超出限制
+    :raises ExecutorSaturatedError: 进程池已满
+    :raises ExecutorTimeoutError: 处理超时
+    """
+    try:
+        info = inspect_image(image_data, max_size)
+    except ImageRejectedError as e:
+        ingest_stats.record_rejected(e.reason)
+        logger.warning(f"图片被拒绝: {str(e)}", extra={'reason': e.reason, 'bytes': len(image_data)})
+        raise
+
+    start = time.perf_counter()
+    pool = get_image_pool()
+    if pool is None:
+        result, memory = _process_in_current_process(image_data, max_size)
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(image_data)))
+        try:
+            shm.buf[:len(image_data)] = image_data
+            future = pool.submit(_process_shared, shm.name, len(image_data), max_size)
+            result, memory = wait_result(future, config.IMAGE_PROCESS_TIMEOUT)
+        except BrokenProcessPool as e:
+            # 工作进程异常退出，多半是内存不足被杀，重建进程池；不在请求进程中重试，避免拖垮整个实例
+            logger.error(f"图片处理进程池异常: {str(e)}", extra=dict(info, bytes=len(image_data)))
+            _reset_image_pool(pool)
+            raise RuntimeError('图片处理进程异常退出') from e
+        finally:
+            shm.close()
+            shm.unlink()
+
+    duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    ingest_stats.record(info, memory, duration_ms)
+    logger.info('图片处理完成', extra=dict(info, bytes=len(image_data), duration_ms=duration_ms, **memory))
+    return result
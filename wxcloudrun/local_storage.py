@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import io
+import os
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+
+
+class LocalStorageError(Exception):
+    """本地存储对象不存在或签名无效"""
+
+
+class _LocalBody:
+    def __init__(self, data):
+        self._data = data
+
+    def get_raw_stream(self):
+        return io.BytesIO(self._data)
+
+
+class LocalStorageClient:
+    """
+    本地文件系统实现的存储替身，接口与CosS3Client中用到的方法保持一致，
+    用于本地调试和测试直传流程，不依赖腾讯云COS
+    """
+
+    def __init__(self, root, base_url, secret):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        self.secret = secret.encode('utf-8')
+
+    def _path(self, Bucket, Key):
+        path = os.path.abspath(os.path.join(self.root, Bucket, Key))
+        if not path.startswith(os.path.join(self.root, Bucket) + os.sep):
+            raise LocalStorageError(f'非法的对象路径: {Key}')
+        return path
+
+    def _sign(self, method, bucket, key, expires):
+        message = f'{method}\n{bucket}\n{key}\n{expires}'.encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def put_object(self, Bucket, Body, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = Body if isinstance(Body, bytes) else Body.read()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return {'ETag': hashlib.md5(data).hexdigest()}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalStorageError(f'对象不存在: {Key}')
+        with open(path, 'rb') as f:
+            return {'Body': _LocalBody(f.read())}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalStorageError(f'对象不存在: {Key}')
+        return {'Content-Length': str(os.path.getsize(path))}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        return {}
+
+    def list_objects(self, Bucket, Prefix='', Marker='', MaxKeys=1000, **kwargs):
+        bucket_root = os.path.join(self.root, Bucket)
+        keys = []
+        for directory, _, filenames in os.walk(bucket_root):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(directory, filename), bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix) and key > Marker and not key.endswith('.tmp'):
+                    keys.append(key)
+        keys.sort()
+
+        contents = []
+        for key in keys[:MaxKeys]:
+            stat = os.stat(os.path.join(bucket_root, key))
+            contents.append({
+                'Key': key,
+                'Size': str(stat.st_size),
+                'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            })
+        return {
+            'Contents': contents,
+            'IsTruncated': 'true' if len(keys) > MaxKeys else 'false',
+            'NextMarker': contents[-1]['Key'] if len(keys) > MaxKeys else ''
+        }
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        errors = []
+        for item in Delete['Object']:
+            try:
+                self.delete_object(Bucket, item['Key'])
+            except (LocalStorageError, OSError) as e:
+                errors.append({'Key': item['Key'], 'Code': 'InternalError', 'Message': str(e)})
+        return {'Error': errors} if errors else {}
+
+    def head_bucket(self, Bucket, **kwargs):
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+        return {}
+
+    def get_presigned_url(self, Bucket, Key, Method, Expired=300, **kwargs):
+        expires = int(time.time()) + Expired
+        query = urlencode({'expires': expires, 'signature': self._sign(Method, Bucket, Key, expires)})
+        return f'{self.base_url}/api/storage/local/{quote(Bucket)}/{quote(Key)}?{query}'
+
+    def verify_presigned(self, method, bucket, key, expires, signature):
+        """
+        校验预签名URL
+        :return: 签名有效且未过期时返回True
+        """
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._sign(method, bucket, key, expires), signature or '')
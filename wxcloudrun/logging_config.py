@@ -0,0 +1,162 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+
+# 日志记录中不输出到JSON的标准属性
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """输出单行JSON，extra中的字段原样展开"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if has_request_context() and 'request_id' in g:
+            data['request_id'] = g.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃日志而不是阻塞请求线程，并记录丢弃数量"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # 在请求线程中完成格式化，后台线程不再访问请求上下文
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging():
+    """
+    日志统一经过有界队列，由后台线程写到stdout，请求线程不执行I/O
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    queue_handler.setFormatter(JsonFormatter())
+
+    for name in ('log', 'access'):
+        logger = logging.getLogger(name)
+        logger.handlers = [queue_handler]
+        logger.setLevel(config.LOG_LEVEL)
+        logger.propagate = False
+
+    _listener = QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+# ==================== Request Timing ====================
+
+def add_timing(name, seconds):
+    """
+    累加当前请求在某类外部调用上的耗时
+    :param name: 计时类别，如db、cos、image
+    :param seconds: 耗时(秒)
+    """
+    if has_request_context():
+        timings = g.setdefault('timings', {})
+        timings[name] = timings.get(name, 0) + seconds
+
+
+@contextmanager
+def timed(name):
+    """
+    统计代码块耗时并计入当前请求
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if starts:
+        add_timing('db', time.perf_counter() - starts.pop())
+
+
+def init_app(app):
+    """
+    注册请求钩子，为每个请求分配请求ID并输出JSON访问日志
+    """
+    access_logger = logging.getLogger('access')
+
+    @app.before_request
+    def _start_access_log():
+        g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+        g.access_start = time.perf_counter()
+
+    @app.after_request
+    def _write_access_log(response):
+        response.headers['X-Request-Id'] = g.get('request_id', '')
+        if not config.ACCESS_LOG_ENABLED or 'access_start' not in g:
+            return response
+
+        total_ms = (time.perf_counter() - g.access_start) * 1000
+        # 错误和慢请求总是记录，其余请求按采样率记录
+        if response.status_code < 500 and total_ms < config.ACCESS_LOG_SLOW_MS and \
+                random.random() >= config.ACCESS_LOG_SAMPLE_RATE:
+            return response
+
+        timings = g.get('timings', {})
+        access_logger.info('access', extra={
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else request.path,
+            'path': request.path,
+            'status': response.status_code,
+            'db_ms': round(timings.get('db', 0) * 1000, 2),
+            'cos_ms': round(timings.get('cos', 0) * 1000, 2),
+            'image_ms': round(timings.get('image', 0) * 1000, 2),
+            'total_ms': round(total_ms, 2)
+        })
+        return response
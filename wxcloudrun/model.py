@@ -23,8 +23,24 @@ class CoverPicture(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     picture_name = db.Column(db.String(255), nullable=False, unique=True)
     file_url = db.Column(db.String(500), nullable=False)
-    primary_cover = db.Column(db.Boolean, default=False)
+    primary_cover = db.Column(db.Boolean, default=False, index=True)
     major_color = db.Column(db.String(7))  # Store hex color like #FF5733
+    created_at = db.Column('createdAt', db.TIMESTAMP, nullable=False, default=func.now(), index=True)
+    updated_at = db.Column('updatedAt', db.TIMESTAMP, nullable=False, default=func.now(), onupdate=func.now())
+
+
+# 封面直传任务表
+class CoverUpload(db.Model):
+    __tablename__ = 'cover_upload'
+
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.String(64), nullable=False, unique=True)
+    object_key = db.Column(db.String(500), nullable=False)  # 客户端直传的原图路径
+    original_filename = db.Column(db.String(255), nullable=False)
+    primary_cover = db.Column(db.Boolean, default=False)
+    status = db.Column(db.Enum('PENDING', 'PROCESSING', 'DONE', 'FAILED'), default='PENDING', index=True)
+    picture_name = db.Column(db.String(255))
+    error_message = db.Column(db.String(500))
     created_at = db.Column('createdAt', db.TIMESTAMP, nullable=False, default=func.now())
     updated_at = db.Column('updatedAt', db.TIMESTAMP, nullable=False, default=func.now(), onupdate=func.now())
 
@@ -35,9 +51,21 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     userid = db.Column(db.String(100), nullable=False, unique=True)  # WeChat ID
-    user_name = db.Column(db.String(100), nullable=False)
+    user_name = db.Column(db.String(100), nullable=False, index=True)
     comment = db.Column(db.Text)
-    role = db.Column(db.Enum('ADMIN', 'VIP', 'GUEST'), default='GUEST')
+    role = db.Column(db.Enum('ADMIN', 'VIP', 'GUEST'), default='GUEST', index=True)
     extra_message = db.Column(db.Text)
-    created_at = db.Column('createdAt', db.TIMESTAMP, nullable=False, default=func.now())
+    created_at = db.Column('createdAt', db.TIMESTAMP, nullable=False, default=func.now(), index=True)
     updated_at = db.Column('updatedAt', db.TIMESTAMP, nullable=False, default=func.now(), onupdate=func.now())
+
+
+# 数据变更日志表，供变更订阅接口按版本号增量拉取
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (db.Index('ix_change_log_topic_id', 'topic', 'id'),)
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)  # 即版本号
+    topic = db.Column(db.String(20), nullable=False)  # cover 或 user
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.Enum('INSERT', 'UPDATE', 'DELETE'), nullable=False)
+    created_at = db.Column('createdAt', db.TIMESTAMP, nullable=False, default=func.now())
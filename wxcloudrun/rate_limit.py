@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import wraps
+
+from flask import request
+
+import config
+from wxcloudrun.response import make_err_response
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台只做进程内互斥
+    fcntl = None
+
+logger = logging.getLogger('log')
+
+# 每个槽位: key哈希(uint64) + 剩余令牌(double) + 上次补充时间(double)
+_SLOT = struct.Struct('<Qdd')
+# 哈希冲突时最多向后探测的槽位数
+_PROBE = 4
+
+
+class TokenBucketStore:
+    """
+    基于共享内存文件的令牌桶存储，同一台机器上的所有工作进程共用同一份状态。
+    文件被映射为定长槽位表，按key哈希定位槽位，表满时淘汰最久未访问的槽位。
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._mm = None
+
+    def _ensure_open(self):
+        # fork出的子进程不能复用父进程的文件描述符，否则flock无法在进程间互斥
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        size = self.slots * _SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._mm = mmap.mmap(fd, size)
+        self._fd = fd
+        self._pid = pid
+
+    def consume(self, key, rate, burst):
+        """
+        尝试从key对应的桶中取出一个令牌
+        :param key: 限流键
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶容量
+        :return: (是否允许, 需要等待的秒数)
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        with self._thread_lock:
+            self._ensure_open()
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.monotonic()
+                offset = self._find_slot(key_hash)
+                slot_hash, tokens, updated = _SLOT.unpack_from(self._mm, offset)
+                if slot_hash != key_hash:
+                    tokens, updated = float(burst), now
+                tokens = min(float(burst), tokens + (now - updated) * rate)
+
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                _SLOT.pack_into(self._mm, offset, key_hash, tokens, now)
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        if allowed:
+            return True, 0
+        return False, (1 - tokens) / rate if rate > 0 else 1
+
+    def _find_slot(self, key_hash):
+        start = key_hash % self.slots
+        victim, victim_updated = None, None
+        for i in range(_PROBE):
+            offset = ((start + i) % self.slots) * _SLOT.size
+            slot_hash, _, updated = _SLOT.unpack_from(self._mm, offset)
+            if slot_hash == key_hash or slot_hash == 0:
+                return offset
+            if victim is None or updated < victim_updated:
+                victim, victim_updated = offset, updated
+        return victim
+
+
+def _default_store_path():
+    # 优先使用内存文件系统
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp'
+    return os.path.join(directory, 'yesidosvc_ratelimit')
+
+
+bucket_store = TokenBucketStore(config.RATE_LIMIT_STORE_PATH or _default_store_path(), config.RATE_LIMIT_SLOTS)
+
+
+def get_client_identity():
+    """
+    获取调用方标识：经微信网关调用时使用云托管注入的openid，其他情况使用客户端IP
+    :return: 标识字符串
+    """
+    # 公网请求的X-WX-OPENID可以由调用方随意填写，轮换取值即可绕过限流；
+    # 只有带X-WX-SOURCE(微信网关注入)的请求才信任其中的openid
+    openid = request.headers.get('X-WX-OPENID')
+    if openid and request.headers.get('X-WX-SOURCE'):
+        return f'openid:{openid}'
+    # 左侧的条目由客户端填写，可以伪造，只使用网关追加的最右侧条目
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    if forwarded_for:
+        client_ip = forwarded_for.split(',')[-1].strip()
+        if client_ip:
+            return f'ip:{client_ip}'
+    return f'ip:{request.remote_addr}'
+
+
+def rate_limit(name, rate, burst):
+    """
+    按调用方限流的装饰器
+    :param name: 限流规则名，不同接口的桶互相独立
+    :param rate: 每秒补充的令牌数
+    :param burst: 桶容量，即允许的突发请求数
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not config.RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+            try:
+                allowed, retry_after = bucket_store.consume(f'{name}:{get_client_identity()}', rate, burst)
+            except OSError as e:
+                # 限流存储不可用时放行，避免影响正常请求
+                logger.error(f"限流存储不可用: {str(e)}")
+                return f(*args, **kwargs)
+            if not allowed:
+                response = make_err_response('请求过于频繁，请稍后重试')
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response, 429
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
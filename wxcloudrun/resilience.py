@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后进入打开状态，在reset_timeout内直接拒绝调用；
+    冷却结束后进入半开状态，只放行一个探测调用，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probing = False
+        self._rejected = 0
+
+    def allow(self):
+        """
+        :return: 当前是否允许调用
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """
+        放行的调用没有给出结果(如被中断)时释放半开状态下的探测名额，由下一个调用重新探测
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'rejected': self._rejected
+            }
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    指数退避加随机抖动
+    :param attempt: 已重试次数，从0开始
+    :return: 等待秒数
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
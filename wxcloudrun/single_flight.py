@@ -0,0 +1,79 @@
+import threading
+from collections import defaultdict
+from functools import wraps
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    请求合并：同一进程内参数相同的并发调用只执行一次，其余调用等待并共享结果
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = defaultdict(lambda: {'calls': 0, 'executions': 0, 'coalesced': 0})
+
+    def do(self, name, key, fn, *args, **kwargs):
+        """
+        执行fn，如果相同key的调用正在进行则等待其结果
+        :param name: 统计用的名称
+        :param key: 合并键
+        :return: fn的返回值
+        """
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                stats['executions'] += 1
+            else:
+                stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        """
+        :return: 各函数的调用次数、实际执行次数和被合并的次数
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+flight_group = SingleFlight()
+
+
+def single_flight(f):
+    """
+    将函数的并发相同调用合并为一次执行。
+    只用于只读且返回值不绑定会话的函数，结果会被多个线程共享，调用方不应修改。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = (f.__qualname__, repr(args), repr(sorted(kwargs.items())))
+        return flight_group.do(f.__name__, key, f, *args, **kwargs)
+    return decorated_function
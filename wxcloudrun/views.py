@@ -1,21 +1,41 @@
 from datetime import datetime
+import logging
 import os
-from flask import render_template, request, send_file, abort, jsonify
+from flask import render_template, request, send_file, abort, jsonify, Response, after_this_request
 from urllib.parse import unquote
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
 from functools import wraps
 from run import app
+from wxcloudrun import replica_router
 from wxcloudrun.dao import (
     delete_counterbyid, query_counterbyid, insert_counter, update_counterbyid,
-    insert_cover_picture, query_cover_picture_by_name, query_all_cover_pictures, 
-    delete_cover_picture_by_name, update_primary_cover,
-    insert_user, query_user_by_id, query_user_by_userid, query_all_users, 
-    update_user, delete_user_by_id
+    insert_cover_picture, query_cover_picture_by_name, query_cover_pictures,
+    clear_primary_covers, delete_cover_picture_entity,
+    insert_user, query_user_by_id, query_user_by_userid,
+    update_user, query_users, count_users_by_role, query_user_row_by_userid,
+    delete_user_entity, unit_of_work, query_cover_upload,
+    COVER_PICTURE_FIELDS, USER_FIELDS, DatabaseUnavailableError, db_breaker
 )
 from wxcloudrun.model import Counters, CoverPicture, User
 from wxcloudrun.response import make_succ_empty_response, make_succ_response, make_err_response
-from wxcloudrun.cos_client import cos_client
+from wxcloudrun.cos_client import cos_client, cos_executor
+from wxcloudrun.direct_upload import create_upload, finalize_upload, upload_to_dict
+from wxcloudrun.executor import ExecutorSaturatedError, ExecutorTimeoutError, wait_result
+from wxcloudrun.image_guard import ImageRejectedError, ingest_stats
+from wxcloudrun.rate_limit import rate_limit
+from wxcloudrun.single_flight import flight_group
+from wxcloudrun.change_feed import ChangeFeedBusyError, InvalidVersionError, change_notifier, poll_changes
+from wxcloudrun.warmup import is_ready, warmup_state
+from wxcloudrun.local_storage import LocalStorageError
+from wxcloudrun.logging_config import DroppingQueueHandler, add_timing, timed
 import config
 
+logger = logging.getLogger('log')
+
+# 允许上传的封面图片扩展名
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
 
 @app.route('/')
 def index():
@@ -26,6 +46,7 @@ def index():
 
 
 @app.route('/api/count', methods=['POST'])
+@rate_limit('count', config.RATE_LIMIT_COUNT_RATE, config.RATE_LIMIT_COUNT_BURST)
 def count():
     """
     :return:计数结果/清除结果
@@ -43,19 +64,20 @@ def count():
 
     # 执行自增操作
     if action == 'inc':
-        counter = query_counterbyid(1)
-        if counter is None:
-            counter = Counters()
-            counter.id = 1
-            counter.count = 1
-            counter.created_at = datetime.now()
-            counter.updated_at = datetime.now()
-            insert_counter(counter)
-        else:
-            counter.id = 1
-            counter.count += 1
-            counter.updated_at = datetime.now()
-            update_counterbyid(counter)
+        with unit_of_work(expire_on_commit=False):
+            counter = query_counterbyid(1)
+            if counter is None:
+                counter = Counters()
+                counter.id = 1
+                counter.count = 1
+                counter.created_at = datetime.now()
+                counter.updated_at = datetime.now()
+                insert_counter(counter)
+            else:
+                counter.id = 1
+                counter.count += 1
+                counter.updated_at = datetime.now()
+                update_counterbyid(counter)
         return make_succ_response(counter.count)
 
     # 执行清0操作
@@ -73,9 +95,25 @@ def get_count():
     """
     :return: 计数的值
     """
-    counter = Counters.query.filter(Counters.id == 1).first()
+    counter = query_counterbyid(1)
     return make_succ_response(0) if counter is None else make_succ_response(counter.count)
 
+@app.errorhandler(DatabaseUnavailableError)
+def handle_database_unavailable(e):
+    """
+    数据库不可用时统一返回503，接口中的通用异常处理需要先把DatabaseUnavailableError重新抛出
+    """
+    return make_err_response('数据库暂不可用，请稍后重试'), 503
+
+
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    """
+    请求体超过MAX_CONTENT_LENGTH
+    """
+    return make_err_response('文件过大'), 413
+
+
 # ==================== Admin Authentication Decorator ====================
 
 def admin_required(f):
@@ -87,12 +125,88 @@ def admin_required(f):
         admin_secret = request.headers.get('Admin-Secret')
         if not admin_secret or admin_secret != config.ADMIN_SECRET:
             return make_err_response('无管理员权限'), 403
-        return f(*args, **kwargs)
+        if request.method == 'GET':
+            return f(*args, **kwargs)
+        # 管理员写操作完成(已提交)后的一段时间内读操作走主库，避免从库延迟导致读不到刚写入的数据。
+        # 上传等写操作可能耗时较长，窗口需要从提交之后开始计算；后续请求可能落到其他实例，
+        # 写入令牌随响应返回给客户端
+        after_this_request(replica_router.attach_write_token)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            replica_router.mark_write()
     return decorated_function
 
 
+# ==================== List Query Helpers ====================
+
+def parse_fields(allowed_fields):
+    """
+    解析请求中的fields参数
+    :param allowed_fields: 允许的字段
+    :return: (字段列表, 错误信息)，未传fields时字段列表为全部字段
+    """
+    fields_param = request.args.get('fields', '').strip()
+    if not fields_param:
+        return list(allowed_fields), None
+
+    fields = []
+    for field in fields_param.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field not in allowed_fields:
+            return None, f'不支持的字段: {field}'
+        if field not in fields:
+            fields.append(field)
+    return fields or list(allowed_fields), None
+
+
+def parse_datetime_arg(name):
+    """
+    解析请求中的时间参数，支持 YYYY-MM-DD 和 YYYY-MM-DD HH:MM:SS
+    :param name: 参数名
+    :return: (datetime或None, 错误信息)
+    """
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None, None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt), None
+        except ValueError:
+            continue
+    return None, f'{name}格式错误'
+
+
+def serialize_row(row, fields):
+    """
+    将查询结果行转换为字典，时间字段格式化为字符串
+    :param row: 查询结果行
+    :param fields: 字段列表
+    :return: 字典
+    """
+    result = {}
+    for field in fields:
+        value = getattr(row, field)
+        if field in ('created_at', 'updated_at') and value is not None:
+            value = value.strftime('%Y-%m-%d %H:%M:%S')
+        result[field] = value
+    return result
+
+
 # ==================== Cover Picture APIs ====================
 
+def cover_name_exists(picture_name):
+    """
+    在COS执行器线程中检查图片名称是否已有封面记录
+    :param picture_name: 图片名称
+    :return: bool
+    """
+    with app.app_context():
+        return query_cover_picture_by_name(picture_name) is not None
+
+
 @app.route('/api/cover/upload', methods=['POST'])
 @admin_required
 def upload_cover_picture():
@@ -109,9 +223,8 @@ def upload_cover_picture():
             return make_err_response('没有选择文件')
         
         # 检查文件类型
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
         file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_EXTENSIONS:
             return make_err_response('不支持的文件格式')
         
         # 获取其他参数
@@ -121,8 +234,17 @@ def upload_cover_picture():
         # 读取文件数据
         file_data = file.read()
         
-        # 上传到COS
-        success, result, picture_name, major_color = cos_client.upload_cover_image(file_data, file.filename)
+        # 处理图片并上传到COS，图片处理和存储调用分别计时
+        upload_timings = {}
+        try:
+            success, result, picture_name, major_color = wait_result(
+                cos_client.upload_cover_image_async(file_data, file.filename, name_exists=cover_name_exists,
+                                                    timings=upload_timings),
+                config.COS_UPLOAD_TIMEOUT
+            )
+        finally:
+            for name, seconds in list(upload_timings.items()):
+                add_timing(name, seconds)
         
         if not success:
             return make_err_response(f'上传失败: {result}')
@@ -136,26 +258,115 @@ def upload_cover_picture():
         cover_picture.created_at = datetime.now()
         cover_picture.updated_at = datetime.now()
         
-        if insert_cover_picture(cover_picture):
-            # 如果设置为主封面，更新其他图片的主封面状态
-            if primary_cover:
-                update_primary_cover(picture_name, True)
-            
-            return make_succ_response({
-                'picture_name': picture_name,
-                'file_url': result,
-                'primary_cover': primary_cover,
-                'major_color': major_color
-            })
-        else:
-            # 如果数据库保存失败，删除COS中的文件
-            cos_client.delete_cover_image(picture_name)
+        try:
+            # 插入记录和更新其他图片的主封面状态在同一个事务中提交
+            with unit_of_work():
+                if primary_cover:
+                    clear_primary_covers()
+                insert_cover_picture(cover_picture)
+        except IntegrityError:
+            # 并发上传了同名图片，对象已被另一个请求的记录引用，不能删除
+            return make_err_response(f'图片已存在: {picture_name}')
+        except Exception as e:
+            # 如果数据库保存失败，删除本次上传的COS文件，不等待删除结果
+            try:
+                cos_client.delete_cover_image_async(picture_name)
+            except ExecutorSaturatedError:
+                logger.error(f"COS执行器已满，未能清理文件: {picture_name}")
+            if isinstance(e, DatabaseUnavailableError):
+                raise
             return make_err_response('保存到数据库失败')
+        
+        return make_succ_response({
+            'picture_name': picture_name,
+            'file_url': result,
+            'primary_cover': primary_cover,
+            'major_color': major_color
+        })
             
+    except ImageRejectedError as e:
+        # 无法识别的图片返回400，超出大小、像素、帧数或内存限制返回413
+        status = 400 if e.reason in ('invalid', 'format') else 413
+        return make_err_response(f'图片不符合要求: {str(e)}'), status
+    except RequestEntityTooLarge:
+        # 读取request.files时才会发现请求体超限，交给413处理
+        raise
+    except ExecutorSaturatedError:
+        return make_err_response('存储服务繁忙，请稍后重试'), 503
+    except ExecutorTimeoutError:
+        return make_err_response('存储服务超时，请稍后重试'), 504
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'上传失败: {str(e)}')
 
 
+@app.route('/api/cover/upload/presign', methods=['POST'])
+@admin_required
+def presign_cover_upload():
+    """
+    创建封面直传任务，返回预签名上传地址 (仅管理员)
+    """
+    try:
+        data = request.get_json() or {}
+        filename = data.get('filename', '')
+        if not filename:
+            return make_err_response('缺少必需字段: filename')
+        
+        # 检查文件类型
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext not in ALLOWED_EXTENSIONS:
+            return make_err_response('不支持的文件格式')
+        
+        primary_cover = str(data.get('primary_cover', 'false')).lower() == 'true'
+        return make_succ_response(create_upload(filename, primary_cover))
+        
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        return make_err_response(f'创建上传任务失败: {str(e)}')
+
+
+@app.route('/api/cover/upload/<upload_id>/finalize', methods=['POST'])
+@admin_required
+def finalize_cover_upload(upload_id):
+    """
+    客户端直传完成后提交后台处理，重复调用返回当前状态 (仅管理员)
+    """
+    try:
+        cover_upload = finalize_upload(upload_id)
+        if not cover_upload:
+            return make_err_response('上传任务不存在')
+        
+        return make_succ_response(upload_to_dict(cover_upload))
+        
+    except ExecutorSaturatedError:
+        return make_err_response('存储服务繁忙，请稍后重试'), 503
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        return make_err_response(f'提交上传任务失败: {str(e)}')
+
+
+@app.route('/api/cover/upload/<upload_id>', methods=['GET'])
+@admin_required
+def get_cover_upload(upload_id):
+    """
+    查询直传任务状态 (仅管理员)
+    """
+    try:
+        cover_upload = query_cover_upload(upload_id)
+        if not cover_upload:
+            return make_err_response('上传任务不存在')
+        
+        return make_succ_response(upload_to_dict(cover_upload))
+        
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        return make_err_response(f'查询上传任务失败: {str(e)}')
+
+
 @app.route('/api/cover/<picture_name>', methods=['DELETE'])
 @admin_required
 def delete_cover_picture(picture_name):
@@ -169,16 +380,26 @@ def delete_cover_picture(picture_name):
             return make_err_response('图片不存在')
         
         # 从COS删除文件
-        success, message = cos_client.delete_cover_image(picture_name)
+        with timed('cos'):
+            success, message = wait_result(
+                cos_client.delete_cover_image_async(picture_name),
+                config.COS_DELETE_TIMEOUT
+            )
         if not success:
             return make_err_response(f'删除COS文件失败: {message}')
         
         # 从数据库删除记录
-        if delete_cover_picture_by_name(picture_name):
+        if delete_cover_picture_entity(cover_picture):
             return make_succ_response({'message': '删除成功'})
         else:
             return make_err_response('删除数据库记录失败')
             
+    except ExecutorSaturatedError:
+        return make_err_response('存储服务繁忙，请稍后重试'), 503
+    except ExecutorTimeoutError:
+        return make_err_response('存储服务超时，请稍后重试'), 504
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'删除失败: {str(e)}')
 
@@ -189,25 +410,22 @@ def list_cover_pictures():
     获取封面图片列表
     """
     try:
-        cover_pictures = query_all_cover_pictures()
-        
-        result = []
-        for picture in cover_pictures:
-            result.append({
-                'id': picture.id,
-                'picture_name': picture.picture_name,
-                'file_url': picture.file_url,
-                'primary_cover': picture.primary_cover,
-                'major_color': picture.major_color,
-                'created_at': picture.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'updated_at': picture.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
+        fields, error = parse_fields(COVER_PICTURE_FIELDS)
+        if error:
+            return make_err_response(error)
+        primary_only = request.args.get('primary_only', 'false').lower() == 'true'
+
+        cover_pictures = query_cover_pictures(fields, primary_only=primary_only)
+        
+        result = [serialize_row(picture, fields) for picture in cover_pictures]
         
         return make_succ_response({
             'pictures': result,
             'total': len(result)
         })
         
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'获取图片列表失败: {str(e)}')
 
@@ -246,7 +464,10 @@ def create_user():
         if user.role not in ['ADMIN', 'VIP', 'GUEST']:
             return make_err_response('无效的角色类型')
         
-        if insert_user(user):
+        with unit_of_work(expire_on_commit=False):
+            inserted = insert_user(user)
+        
+        if inserted:
             return make_succ_response({
                 'id': user.id,
                 'userid': user.userid,
@@ -259,6 +480,8 @@ def create_user():
         else:
             return make_err_response('创建用户失败')
             
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'创建用户失败: {str(e)}')
 
@@ -270,30 +493,59 @@ def list_users():
     获取用户列表 (仅管理员)
     """
     try:
-        users = query_all_users()
+        fields, error = parse_fields(USER_FIELDS)
+        if error:
+            return make_err_response(error)
         
-        result = []
-        for user in users:
-            result.append({
-                'id': user.id,
-                'userid': user.userid,
-                'user_name': user.user_name,
-                'comment': user.comment,
-                'role': user.role,
-                'extra_message': user.extra_message,
-                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'updated_at': user.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
+        role = request.args.get('role')
+        if role and role not in ['ADMIN', 'VIP', 'GUEST']:
+            return make_err_response('无效的角色类型')
+        
+        created_after, error = parse_datetime_arg('created_after')
+        if error:
+            return make_err_response(error)
+        
+        users = query_users(
+            fields,
+            role=role,
+            user_name_prefix=request.args.get('user_name'),
+            created_after=created_after
+        )
+        
+        result = [serialize_row(user, fields) for user in users]
         
         return make_succ_response({
             'users': result,
             'total': len(result)
         })
         
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'获取用户列表失败: {str(e)}')
 
 
+@app.route('/api/users/stats', methods=['GET'])
+@admin_required
+def get_user_stats():
+    """
+    按角色统计用户数量 (仅管理员)
+    """
+    try:
+        role_counts = count_users_by_role()
+        roles = {role: role_counts.get(role, 0) for role in ['ADMIN', 'VIP', 'GUEST']}
+        
+        return make_succ_response({
+            'roles': roles,
+            'total': sum(roles.values())
+        })
+        
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        return make_err_response(f'获取用户统计失败: {str(e)}')
+
+
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 @admin_required
 def get_user_by_id(user_id):
@@ -316,6 +568,8 @@ def get_user_by_id(user_id):
             'updated_at': user.updated_at.strftime('%Y-%m-%d %H:%M:%S')
         })
         
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'获取用户信息失败: {str(e)}')
 
@@ -350,7 +604,10 @@ def update_user_by_id(user_id):
         
         existing_user.updated_at = datetime.now()
         
-        if update_user(existing_user):
+        with unit_of_work(expire_on_commit=False):
+            updated = update_user(existing_user)
+        
+        if updated:
             return make_succ_response({
                 'id': existing_user.id,
                 'userid': existing_user.userid,
@@ -363,6 +620,8 @@ def update_user_by_id(user_id):
         else:
             return make_err_response('更新用户失败')
             
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'更新用户失败: {str(e)}')
 
@@ -379,35 +638,152 @@ def delete_user_by_id_api(user_id):
         if not user:
             return make_err_response('用户不存在')
         
-        if delete_user_by_id(user_id):
+        if delete_user_entity(user):
             return make_succ_response({'message': '删除成功'})
         else:
             return make_err_response('删除用户失败')
             
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'删除用户失败: {str(e)}')
 
 
 @app.route('/api/user/<userid>', methods=['GET'])
+@rate_limit('user_info', config.RATE_LIMIT_USER_INFO_RATE, config.RATE_LIMIT_USER_INFO_BURST)
 def get_user_info(userid):
     """
     获取用户信息 (根据微信ID)
     """
     try:
-        user = query_user_by_userid(userid)
+        user = query_user_row_by_userid(userid)
         if not user:
             return make_err_response('用户不存在')
         
-        return make_succ_response({
-            'id': user.id,
-            'userid': user.userid,
-            'user_name': user.user_name,
-            'comment': user.comment,
-            'role': user.role,
-            'extra_message': user.extra_message,
-            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': user.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        return make_succ_response(serialize_row(user, USER_FIELDS))
         
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return make_err_response(f'获取用户信息失败: {str(e)}')
+
+
+# ==================== Change Feed APIs ====================
+
+# 变更订阅各主题返回的字段
+CHANGE_FEED_FIELDS = {
+    'cover': COVER_PICTURE_FIELDS,
+    'user': USER_FIELDS
+}
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    变更订阅：长轮询等待封面或用户数据在since版本之后发生变化，返回新增、删除和修改的记录。
+    user主题需要管理员权限
+    """
+    topics = []
+    for topic in request.args.get('topics', 'cover').split(','):
+        topic = topic.strip()
+        if topic not in CHANGE_FEED_FIELDS:
+            return make_err_response(f'不支持的主题: {topic}')
+        if topic not in topics:
+            topics.append(topic)
+    if 'user' in topics and request.headers.get('Admin-Secret') != config.ADMIN_SECRET:
+        return make_err_response('无管理员权限'), 403
+
+    since = request.args.get('since')
+    try:
+        since = int(since) if since not in (None, '') else None
+        timeout = min(max(float(request.args.get('timeout', config.CHANGE_FEED_MAX_TIMEOUT)), 0),
+                      config.CHANGE_FEED_MAX_TIMEOUT)
+    except ValueError:
+        return make_err_response('since或timeout格式错误')
+
+    try:
+        delta = poll_changes(topics, since, timeout)
+
+        changes = {}
+        for topic, topic_changes in delta['changes'].items():
+            fields = CHANGE_FEED_FIELDS[topic]
+            changes[topic] = {
+                'added': [serialize_row(row, fields) for row in topic_changes['added']],
+                'changed': [serialize_row(row, fields) for row in topic_changes['changed']],
+                'removed': topic_changes['removed']
+            }
+        return make_succ_response({
+            'version': delta['version'],
+            'reset': delta['reset'],
+            'changes': changes
+        })
+
+    except InvalidVersionError:
+        # 不返回比since更小的版本号，由客户端丢弃本地版本后重新订阅
+        return make_err_response('版本号无效，请重新拉取全量数据后不带since重新订阅'), 400
+    except ChangeFeedBusyError:
+        return make_err_response('订阅请求过多，请稍后重试'), 503
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        return make_err_response(f'获取变更失败: {str(e)}')
+
+
+# ==================== Local Storage APIs ====================
+
+@app.route('/api/storage/local/<bucket>/<path:key>', methods=['PUT', 'GET'])
+def local_storage_object(bucket, key):
+    """
+    本地存储替身的预签名上传和下载，仅在STORAGE_BACKEND为local时可用
+    """
+    if not cos_client.local or bucket != cos_client.bucket:
+        abort(404)
+    
+    storage = cos_client.client
+    if not storage.verify_presigned(request.method, bucket, key,
+                                    request.args.get('expires'), request.args.get('signature')):
+        return make_err_response('签名无效或已过期'), 403
+    
+    try:
+        if request.method == 'PUT':
+            storage.put_object(Bucket=bucket, Body=request.get_data(), Key=key)
+            return make_succ_empty_response()
+        data = storage.get_object(Bucket=bucket, Key=key)['Body'].get_raw_stream().read()
+        return Response(data, mimetype=cos_client._get_content_type(os.path.splitext(key)[1]))
+    except LocalStorageError as e:
+        return make_err_response(str(e)), 404
+
+
+# ==================== Metrics APIs ====================
+
+@app.route('/api/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    """
+    获取进程内运行指标 (仅管理员)
+    """
+    return make_succ_response({
+        'pid': os.getpid(),
+        'single_flight': flight_group.stats(),
+        'cos_executor': cos_executor.stats(),
+        'db_breaker': db_breaker.stats(),
+        'db_replicas': replica_router.stats(),
+        'warmup': warmup_state(),
+        'log_dropped': DroppingQueueHandler.dropped,
+        'change_feed': change_notifier.stats(),
+        'image_ingest': ingest_stats.stats()
+    })
+
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    就绪探针：预热完成前返回503
+    """
+    state = warmup_state()
+    if not is_ready():
+        return make_err_response(f"实例未就绪: {state['status']}"), 503
+    return make_succ_response({
+        'status': state['status'],
+        'duration_ms': state['duration_ms']
+    })
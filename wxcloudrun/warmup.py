@@ -0,0 +1,185 @@
+import io
+import logging
+import threading
+import time
+
+from flask import g, request
+from PIL import Image
+from sqlalchemy import text
+
+import config
+from wxcloudrun import app, db, replica_router
+from wxcloudrun.resilience import backoff_delay
+
+logger = logging.getLogger('log')
+
+# 不计入首个请求统计的探针路径
+PROBE_PATHS = ('/api/ready',)
+
+_lock = threading.Lock()
+_state = {
+    'enabled': config.WARMUP_ENABLED,
+    'status': 'pending',
+    'db_attempts': 0,
+    'started_at': None,
+    'duration_ms': None,
+    'steps': {},
+    'first_request': None
+}
+
+
+def _run_step(name, fn):
+    """
+    执行一个预热步骤并记录耗时
+    :return: 是否成功
+    """
+    start = time.perf_counter()
+    try:
+        fn()
+        ok, error = True, None
+    except Exception as e:
+        ok, error = False, str(e)
+        logger.error(f"预热步骤{name}失败: {error}")
+    with _lock:
+        _state['steps'][name] = {
+            'ok': ok,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+            'error': error
+        }
+    return ok
+
+
+def _fill_db_pool():
+    # 同时持有多个连接，归还后连接池中即有相应数量的空闲连接
+    connections = []
+    try:
+        for _ in range(config.WARMUP_DB_CONNECTIONS):
+            connection = db.engine.connect()
+            connection.execute(text('SELECT 1'))
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _check_replicas():
+    # 逐个检测从库连接，不可用的从库在冷却期内不参与读路由
+    failed = []
+    for bind_key in replica_router.bind_keys:
+        try:
+            with db.get_engine(app, bind=bind_key).connect() as connection:
+                connection.execute(text('SELECT 1'))
+            replica_router.record_success(bind_key)
+        except Exception as e:
+            replica_router.record_failure(bind_key)
+            failed.append(f'{bind_key}: {str(e)}')
+    if failed:
+        raise RuntimeError('; '.join(failed))
+
+
+def _prime_read_paths():
+    from wxcloudrun.dao import query_cover_pictures, query_user_row_by_userid
+    query_cover_pictures()
+    query_user_row_by_userid('')
+    db.session.remove()
+
+
+def _init_storage_client():
+    from wxcloudrun.cos_client import cos_client
+    cos_client.client.head_bucket(Bucket=cos_client.bucket)
+
+
+def _load_image_codecs():
+    Image.init()
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(output, format='JPEG', quality=85)
+    Image.open(io.BytesIO(output.getvalue())).load()
+
+
+def _start_image_pool():
+    # 提前启动图片处理工作进程，避免首次上传承担进程启动开销
+    from wxcloudrun.image_processing import process_cover_image_in_pool
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(output, format='JPEG')
+    process_cover_image_in_pool(output.getvalue())
+
+
+def _warm_up_db():
+    """
+    填充数据库连接池并预热读取路径
+    :return: 是否成功
+    """
+    with _lock:
+        _state['db_attempts'] += 1
+    with app.app_context():
+        return _run_step('db_pool', _fill_db_pool) and _run_step('read_paths', _prime_read_paths)
+
+
+def warm_up():
+    """
+    预热：填充数据库连接池、预热用户和封面读取路径、检测从库、初始化存储客户端、加载图片编解码器、启动图片处理进程。
+    数据库相关步骤成功后实例才进入就绪状态，失败时按退避一直重试(如缩容到零后MySQL仍在恢复)；
+    其余步骤失败只记录不阻塞。
+    """
+    with _lock:
+        _state['started_at'] = time.time()
+    start = time.perf_counter()
+    db_ready = _warm_up_db()
+    with app.app_context():
+        _run_step('db_replicas', _check_replicas)
+    _run_step('storage_client', _init_storage_client)
+    _run_step('image_codecs', _load_image_codecs)
+    _run_step('image_pool', _start_image_pool)
+
+    attempt = 0
+    while not db_ready:
+        with _lock:
+            _state['status'] = 'retrying'
+        time.sleep(backoff_delay(attempt, config.WARMUP_RETRY_BASE_DELAY, config.WARMUP_RETRY_MAX_DELAY))
+        attempt += 1
+        db_ready = _warm_up_db()
+
+    with _lock:
+        _state['duration_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        _state['status'] = 'ready'
+    logger.info(f"预热完成: {_state['db_attempts']}次数据库尝试 {_state['duration_ms']}ms")
+
+
+def start_warmup():
+    """
+    在后台线程中执行预热，未开启预热时直接标记为就绪
+    """
+    if not config.WARMUP_ENABLED:
+        with _lock:
+            _state['status'] = 'ready'
+        return
+    threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+
+def warmup_state():
+    with _lock:
+        return dict(_state, steps=dict(_state['steps']))
+
+
+def is_ready():
+    with _lock:
+        return _state['status'] == 'ready'
+
+
+@app.before_request
+def _mark_request_start():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_first_request(response):
+    # 记录本进程首个业务请求的耗时，用于对比开启和关闭预热时的冷启动延迟
+    if _state['first_request'] is None and request.path not in PROBE_PATHS and 'request_start' in g:
+        with _lock:
+            if _state['first_request'] is None:
+                _state['first_request'] = {
+                    'path': request.path,
+                    'latency_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+                    'warmed_up': _state['enabled'] and _state['status'] == 'ready'
+                }
+    return response